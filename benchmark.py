@@ -0,0 +1,224 @@
+from src import config
+from src import fake_mediatailor
+from src import fake_video_api
+from src import log
+from src import mediatailor as mt
+from src import playlist_parser as pp
+from src import streaminfo as si
+from src import synthetic_playlist
+from src import throttle
+from src import utils
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+logger = log.setup_custom_logger(__name__, loglevel="info")
+logger.debug(f"initiated module: {__name__}")
+
+SIZES = {"day": 1, "week": 7, "month": 31, "year": 365}
+STAGES = [
+    "add_xml",
+    "add_xmls",
+    "get_parsed_programs",
+    "get_chapters_config",
+    "provision",
+    "commit",
+]
+# the fake backend doesn't throttle, neither should the client
+UNLIMITED_RATES = {"read": 10**9, "write": 10**9, "delete": 10**9}
+
+
+def get_input_arguments():
+    arg_desc = """
+    Time parsing, provisioning and commit on synthetic playlists against a local fake backend
+    """
+
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter, description=arg_desc
+    )
+    parser.add_argument(
+        "-s",
+        "--sizes",
+        nargs="*",
+        choices=list(SIZES),
+        default=["day", "week", "month"],
+        help="playlist sizes to benchmark (default: day week month)",
+        dest="sizes",
+        action="store",
+    )
+
+    parser.add_argument(
+        "--stages",
+        nargs="*",
+        choices=STAGES,
+        default=STAGES,
+        help="stages to time (default: all)",
+        dest="stages",
+        action="store",
+    )
+
+    parser.add_argument(
+        "-n",
+        "--repeat",
+        type=int,
+        default=3,
+        help="runs per stage, the best and median are reported (default: 3)",
+        dest="repeat",
+        action="store",
+    )
+
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="number of processes for add_xmls (default: number of cpus)",
+        dest="jobs",
+        action="store",
+    )
+
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=None,
+        help="file to write the json results to (default: stdout)",
+        dest="output",
+        action="store",
+    )
+    return vars(parser.parse_args())
+
+
+def get_timings(runs):
+    return {
+        "best": min(runs),
+        "median": statistics.median(runs),
+        "runs": runs,
+    }
+
+
+def timed(func):
+    started = time.perf_counter()
+    result = func()
+    return (time.perf_counter() - started, result)
+
+
+def get_parser(fnames, first_date, last_date):
+    playlist = pp.PlaylistParser(first_date, last_date)
+    for fname in fnames:
+        playlist.add_xml(fname)
+    return playlist
+
+
+def get_parser_multiprocess(fnames, first_date, last_date, jobs):
+    playlist = pp.PlaylistParser(first_date, last_date)
+    playlist.add_xmls(fnames, max_workers=jobs)
+    return playlist
+
+
+def get_chapters_configs(programs):
+    return [mt.get_chapters_config(program.chapter_offsets_ms) for program in programs]
+
+
+def get_offline_mediatailor():
+    return mt.MediaTailor(
+        client=throttle.ThrottledClient(
+            fake_mediatailor.FakeMediaTailorClient.with_stack(
+                vod_source_location_name=mt.VOD_SOURCE_LOCATION_ID,
+                ads_source_location_name=mt.ADS_SOURCE_LOCATION_ID,
+                slate_ad_name=mt.SLATE_AD_NAME,
+                channel_name=mt.CHANNEL_NAME,
+                get_source_duration_ms=fake_video_api.get_duration_milliseconds,
+            ),
+            rate_limits=UNLIMITED_RATES,
+            min_rate=config.MEDIATAILOR_MIN_RATE,
+            max_retries=0,
+        )
+    )
+
+
+def run_size(size, directory, stages, repeat, jobs):
+    # times every stage `repeat` times on `size` days of playlists, starting tomorrow
+    days = SIZES[size]
+    first_date = (utils.get_UTC_now() + utils.seconds_to_timedelta(24 * 60 * 60)).date()
+    last_date = first_date + utils.seconds_to_timedelta((days - 1) * 24 * 60 * 60)
+    size_directory = os.path.join(directory, size)
+    os.makedirs(size_directory)
+    fnames = synthetic_playlist.write_playlists(
+        size_directory, first_date.isoformat(), days
+    )
+    (first_date, last_date) = (first_date.isoformat(), last_date.isoformat())
+    playlist = get_parser(fnames, first_date, last_date)
+    programs = playlist.get_parsed_programs()
+    timings = {}
+    for stage in stages:
+        runs = []
+        for _ in range(repeat):
+            if stage == "add_xml":
+                (seconds, _) = timed(lambda: get_parser(fnames, first_date, last_date))
+            elif stage == "add_xmls":
+                (seconds, _) = timed(
+                    lambda: get_parser_multiprocess(fnames, first_date, last_date, jobs)
+                )
+            elif stage == "get_parsed_programs":
+                # on a fresh parser, so the timing includes building the index
+                (seconds, _) = timed(
+                    get_parser(fnames, first_date, last_date).get_parsed_programs
+                )
+            elif stage == "get_chapters_config":
+                (seconds, _) = timed(lambda: get_chapters_configs(programs))
+            else:
+                mediatailor = get_offline_mediatailor()
+                (seconds, _) = timed(lambda: mediatailor.provision(programs))
+                if stage == "commit":
+                    for program in programs:
+                        mediatailor.add_to_schedule(program)
+                    (seconds, _) = timed(
+                        lambda: mediatailor.commit(
+                            force=True, day_windows=playlist.get_day_windows()
+                        )
+                    )
+            runs.append(seconds)
+        timings[stage] = get_timings(runs)
+    return {
+        "size": size,
+        "days": days,
+        "files": len(fnames),
+        "bytes": sum(os.path.getsize(fname) for fname in fnames),
+        "programs": len(programs),
+        "events": len(playlist.timeline_store.event_kind),
+        "stages": timings,
+    }
+
+
+if __name__ == "__main__":
+    args = get_input_arguments()
+    # the info logs go to stdout (next to the json) and are per program/adbreak
+    logging.disable(logging.INFO)
+    (_, video_api_url) = fake_video_api.start_video_api_stub()
+    si.set_video_api_url(video_api_url)
+    results = {
+        "started_at": utils.get_UTC_now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "repeat": args["repeat"],
+        "results": [],
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args["sizes"]:
+            results["results"].append(
+                run_size(size, directory, args["stages"], args["repeat"], args["jobs"])
+            )
+            print(f"{size}: done", file=sys.stderr)
+    output = json.dumps(results, indent=2)
+    if args["output"]:
+        with open(args["output"], "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
@@ -1,12 +1,22 @@
+from src import channels as ch
+from src import config
+from src import fake_video_api
+from src import journal as jn
 from src import log
+from src import metrics
+from src import metadata_cache as mc
 from src import mediatailor as mt
+from src import playlist_cache as plc
 from src import playlist_parser as pp
+from src import streaminfo as si
 from src import utils
+from src import watch
 import argparse
+import os
 import sys
 
 logger = log.setup_custom_logger(__name__, loglevel="info")
-logger.info(f"initiated module: {__name__}")
+logger.debug(f"initiated module: {__name__}")
 
 
 def get_input_arguments():
@@ -20,22 +30,38 @@ def get_input_arguments():
     parser.add_argument(
         "-i",
         "--inputfile(s)",
-        required=True,
+        required=False,
+        default=[],
         nargs="*",
         help="the path to the inputfiles in cloudfront format",
         dest="inputfiles",
         action="store",
     )
 
-    parser.add_argument(
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument(
         "-t",
         "--target",
-        required=True,
         help="add programs that are planned on this target day (yyyy-mm-dd).. UTC day-start for now ",
         dest="target_date",
         action="store",
     )
 
+    target.add_argument(
+        "--from",
+        help="add programs that are planned from this day (yyyy-mm-dd) up to and including --to",
+        dest="from_date",
+        action="store",
+    )
+
+    parser.add_argument(
+        "--to",
+        required=False,
+        help="last day (yyyy-mm-dd) to add programs for, used with --from (default: the --from day)",
+        dest="to_date",
+        action="store",
+    )
+
     parser.add_argument(
         "-f",
         "--force",
@@ -44,25 +70,346 @@ def get_input_arguments():
         dest="force",
         action="store_true",  # stores when flag is present
     )
+
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        required=False,
+        type=int,
+        default=None,
+        help="number of processes used to parse the inputfiles (default: number of cpus)",
+        dest="jobs",
+        action="store",
+    )
+
+    parser.add_argument(
+        "--async",
+        required=False,
+        help="run the lookups, vod source and program creation as asyncio tasks",
+        dest="use_async",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "-p",
+        "--pipeline",
+        required=False,
+        help="create programs while the vod sources of the next ones are still being created",
+        dest="pipeline",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--lookahead",
+        required=False,
+        type=int,
+        default=config.PIPELINE_LOOKAHEAD,
+        help=f"number of programs to provision ahead of the one being created with --pipeline (default: {config.PIPELINE_LOOKAHEAD})",
+        dest="lookahead",
+        action="store",
+    )
+
+    parser.add_argument(
+        "-r",
+        "--reconcile",
+        required=False,
+        help="only create/delete the programs that differ from the active schedule",
+        dest="reconcile",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--journal",
+        required=False,
+        help=f"file to log the create calls to (default: {config.JOURNAL_DIR}/<channel>_<from>_<to>.jsonl)",
+        dest="journal",
+        action="store",
+    )
+
+    parser.add_argument(
+        "--resume",
+        required=False,
+        help="continue an interrupted run: skip the calls confirmed in the journal",
+        dest="resume",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--cache-file",
+        required=False,
+        default=config.METADATA_CACHE_FILE,
+        help=f"sqlite file with cached video metadata (default: {config.METADATA_CACHE_FILE})",
+        dest="cache_file",
+        action="store",
+    )
+
+    parser.add_argument(
+        "--no-cache",
+        required=False,
+        help="bypass the video metadata cache",
+        dest="no_cache",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--refresh-cache",
+        required=False,
+        help="fetch all video metadata from the api and refresh the cache",
+        dest="refresh_cache",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--no-playlist-cache",
+        required=False,
+        help=f"parse all inputfiles again instead of using the parsed playlists in {config.PLAYLIST_CACHE_DIR}",
+        dest="no_playlist_cache",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "-w",
+        "--workers",
+        required=False,
+        type=int,
+        default=config.PROVISION_WORKERS,
+        help=f"number of concurrent lookups/vod source creations (default: {config.PROVISION_WORKERS})",
+        dest="workers",
+        action="store",
+    )
+    parser.add_argument(
+        "--offline",
+        required=False,
+        help="run against an in memory MediaTailor and a local video api stub, no cache (for load tests)",
+        dest="offline",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--fake-latency",
+        required=False,
+        type=float,
+        default=config.OFFLINE_LATENCY,
+        help=f"seconds every offline MediaTailor and video api call takes (default: {config.OFFLINE_LATENCY})",
+        dest="fake_latency",
+        action="store",
+    )
+
+    parser.add_argument(
+        "--fake-throttle-ratio",
+        required=False,
+        type=float,
+        default=0,
+        help="share of the offline MediaTailor calls that are throttled at random (default: 0)",
+        dest="fake_throttle_ratio",
+        action="store",
+    )
+    parser.add_argument(
+        "--watch",
+        required=False,
+        help="keep running: reconcile the window again whenever a playlist (*.xml) in this directory changes",
+        dest="watch",
+        action="store",
+    )
+
+    parser.add_argument(
+        "--poll-interval",
+        required=False,
+        type=float,
+        default=config.WATCH_POLL_SECONDS,
+        help=f"seconds between looking for changes with --watch (default: {config.WATCH_POLL_SECONDS})",
+        dest="poll_interval",
+        action="store",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        required=False,
+        help=f"json file for the stage timings and api call metrics of the run (default: {config.METRICS_DIR}/<channel>_<from>_<to>.json)",
+        dest="metrics_file",
+        action="store",
+    )
+
+    parser.add_argument(
+        "--prometheus-file",
+        required=False,
+        help="also write the metrics to this file in the prometheus text format (e.g. for the node exporter textfile collector)",
+        dest="prometheus_file",
+        action="store",
+    )
+    parser.add_argument(
+        "--channels",
+        required=False,
+        help="json file with the channels to schedule concurrently, each with its inputfiles (-i is used for the ones without)",
+        dest="channels",
+        action="store",
+    )
     args = vars(parser.parse_args())
+    if args["to_date"] and not args["from_date"]:
+        parser.error("--to can only be used with --from")
+    if not (args["inputfiles"] or args["watch"] or args["channels"]):
+        parser.error("give the inputfiles (-i), a directory to --watch or --channels")
+    if args["channels"] and (args["watch"] or args["journal"]):
+        parser.error("--channels can't be used with --watch or --journal")
     logger.info(f"received: {args=}")
-    inputfiles = args["inputfiles"]
-    target_date = args["target_date"]
-    force = args["force"]
-    return (inputfiles, target_date, force)
+    return args
+
+
+def get_journal(args, target_date, last_date, channel=mt.DEFAULT_CHANNEL):
+    path = args["journal"] or os.path.join(
+        config.OFFLINE_JOURNAL_DIR if args["offline"] else config.JOURNAL_DIR,
+        f"{channel.name}_{target_date}_{last_date or target_date}.jsonl",
+    )
+    return jn.Journal(path, resume=args["resume"])
+
+
+def get_metadata_cache(args):
+    if args["no_cache"] or args["offline"]:
+        return None
+    return mc.MetadataCache(
+        path=args["cache_file"],
+        ttl=config.METADATA_CACHE_TTL,
+        negative_ttl=config.METADATA_CACHE_NEGATIVE_TTL,
+        refresh=args["refresh_cache"],
+    )
+
+
+def get_playlist_cache(args):
+    if args["no_playlist_cache"]:
+        return None
+    return plc.PlaylistCache(config.PLAYLIST_CACHE_DIR)
+
+
+def write_metrics(args, run_metrics):
+    run_metrics.log_summary()
+    path = args["metrics_file"] or os.path.join(
+        config.METRICS_DIR,
+        "{channel}_{from}_{to}.json".format(**run_metrics.labels),
+    )
+    run_metrics.write_json(path)
+    logger.info(f"metrics written to {path}")
+    if args["prometheus_file"]:
+        run_metrics.write_prometheus(args["prometheus_file"])
+
+
+def get_offline_client(args, channels=(mt.DEFAULT_CHANNEL,)):
+    (_, video_api_url) = fake_video_api.start_video_api_stub(
+        latency=args["fake_latency"]
+    )
+    si.set_video_api_url(video_api_url)
+    return mt.get_offline_client(
+        channels=channels,
+        latency=args["fake_latency"],
+        tps_limits=config.OFFLINE_TPS_LIMITS,
+        throttle_ratio=args["fake_throttle_ratio"],
+        get_source_duration_ms=fake_video_api.get_duration_milliseconds,
+    )
+
+
+def run_channels(args, target_date, last_date, run_metrics):
+    # all channels of the --channels file in one process, returns whether all of them succeeded
+    channels = ch.load_channels(args["channels"], default_inputfiles=args["inputfiles"])
+    configs = [channel for (channel, _) in channels]
+    scheduler = ch.MultiChannelScheduler(
+        client=(
+            get_offline_client(args, configs)
+            if args["offline"]
+            else mt.get_boto_client()
+        ),
+        channels=channels,
+        target_date=target_date,
+        last_date=last_date,
+        use_async=args["use_async"],
+        get_journal=lambda channel: get_journal(args, target_date, last_date, channel),
+        playlist_cache=get_playlist_cache(args),
+        max_workers=args["workers"],
+    )
+    scheduler.start_validation()  # lists the stack while the playlists are parsed
+    with run_metrics.stage("parse"):
+        scheduler.parse(jobs=args["jobs"])
+    with run_metrics.stage("resolve"):
+        scheduler.resolve()
+    with run_metrics.stage("channels"):
+        errors = scheduler.run(
+            args["force"],
+            reconcile=args["reconcile"],
+            pipeline=args["pipeline"],
+            lookahead=args["lookahead"],
+        )
+    write_metrics(args, run_metrics)
+    return not any(errors.values())
 
 
 if __name__ == "__main__":
-    (inputfiles, target_date, force) = get_input_arguments()
-    mt = mt.MediaTailor(create_stack=False)
+    args = get_input_arguments()
+    (inputfiles, target_date, last_date, force) = (
+        args["inputfiles"],
+        args["target_date"] or args["from_date"],
+        args["to_date"],
+        args["force"],
+    )
+    run_metrics = metrics.Metrics(
+        labels={
+            # the channels file (without .json) names a multi channel run
+            "channel": os.path.splitext(os.path.basename(args["channels"]))[0]
+            if args["channels"]
+            else mt.CHANNEL_NAME,
+            "from": target_date,
+            "to": last_date or target_date,
+        }
+    )
+    metrics.set_metrics(run_metrics)
+    si.set_metadata_cache(get_metadata_cache(args))
+    if args["channels"]:
+        sys.exit(0 if run_channels(args, target_date, last_date, run_metrics) else 1)
+    mt = mt.MediaTailor(
+        create_stack=False,
+        use_async=args["use_async"],
+        # a watch run recreates programs by name, the journal would skip them
+        journal=None if args["watch"] else get_journal(args, target_date, last_date),
+        client=get_offline_client(args) if args["offline"] else None,
+    )
+    mt.start_validation()  # lists the stack while the playlists are parsed
+    if args["watch"]:
+        watch.WatchPlanner(
+            mt,
+            target_date,
+            last_date,
+            force=force,
+            playlist_cache=get_playlist_cache(args),
+            max_workers=args["workers"],
+        ).run(
+            watch.PlaylistWatcher(args["watch"]),
+            poll_seconds=args["poll_interval"],
+        )
     # mt.delete_scheduled_programs()
-    playlist = pp.PlaylistParser(target_date)
-
-    for inputfile in inputfiles:
-        playlist.add_xml(inputfile)
+    playlist = pp.PlaylistParser(
+        target_date, last_date, playlist_cache=get_playlist_cache(args)
+    )
 
-    for program in playlist.get_parsed_programs():
-        print(program)
-        mt.add_to_schedule(program)
+    with run_metrics.stage("parse"):
+        playlist.add_xmls(inputfiles, max_workers=args["jobs"])
+        programs = list(playlist.get_parsed_programs())
+    if args["pipeline"] and not args["reconcile"]:
+        with run_metrics.stage("pipeline"):
+            mt.commit_pipelined(programs, force, lookahead=args["lookahead"])
+        print(mt.schedule)
+        write_metrics(args, run_metrics)
+        sys.exit()
+    with run_metrics.stage("provision"):
+        mt.provision(programs, max_workers=args["workers"])
+    with run_metrics.stage("schedule"):
+        for program in programs:
+            print(program)
+            mt.add_to_schedule(program)
     print(mt.schedule)
-    mt.commit(force)
+    if args["reconcile"]:
+        with run_metrics.stage("reconcile"):
+            mt.reconcile(
+                force,
+                window_start=playlist.window_start,
+                window_end=playlist.window_end,
+            )
+    else:
+        with run_metrics.stage("commit"):
+            mt.commit(force, day_windows=playlist.get_day_windows())
+    write_metrics(args, run_metrics)
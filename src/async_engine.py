@@ -0,0 +1,135 @@
+from src import config
+from src import log
+from src import streaminfo as si
+import asyncio
+
+logger = log.setup_custom_logger(__name__, loglevel="info")
+logger.debug(f"initiated module: {__name__}")
+
+
+class AsyncEngine:
+    # runs the blocking boto3/requests calls of a MediaTailor as asyncio tasks in threads,
+    # with at most `concurrency[endpoint]` calls in flight per endpoint
+    def __init__(self, mediatailor, concurrency=None) -> None:
+        self.mediatailor = mediatailor
+        self.concurrency = dict(config.ASYNC_CONCURRENCY, **(concurrency or {}))
+        self._semaphores = {}
+
+    def __repr__(self) -> str:
+        return f"<AsyncEngine for {self.mediatailor} {self.concurrency}>"
+
+    def run(self, coroutine):
+        # semaphores belong to one event loop, start every run with new ones
+        self._semaphores = {}
+        return asyncio.run(coroutine)
+
+    def semaphore(self, endpoint):
+        if endpoint not in self._semaphores:
+            self._semaphores[endpoint] = asyncio.Semaphore(self.concurrency[endpoint])
+        return self._semaphores[endpoint]
+
+    async def call(self, endpoint, func, *args, **kwargs):
+        async with self.semaphore(endpoint):
+            return await asyncio.to_thread(func, *args, **kwargs)
+
+    async def create_vod_source(self, video_asset):
+        return await self.call(
+            "create_vod_source", self.mediatailor.create_vod_source, video_asset
+        )
+
+    async def resolve_and_create(self, wpks):
+        # one batched lookup, the vod sources of that chunk are created as soon as it returns
+        video_assets = await self.call("video_api", si.resolve_video_assets, wpks)
+        created = await asyncio.gather(
+            *(self.create_vod_source(video_asset) for video_asset in video_assets.values())
+        )
+        return (video_assets, dict(zip(video_assets, created)))
+
+    async def create_known(self, video_assets):
+        created = await asyncio.gather(
+            *(self.create_vod_source(video_asset) for video_asset in video_assets.values())
+        )
+        return (video_assets, dict(zip(video_assets, created)))
+
+    async def provision(self, programs):
+        mediatailor = self.mediatailor
+        wpks = mediatailor.get_unprovisioned_wpks(programs)
+        resolved = {
+            wpk: mediatailor._video_assets[wpk]
+            for wpk in wpks
+            if wpk in mediatailor._video_assets
+        }
+        lookup_wpks = [wpk for wpk in wpks if wpk not in resolved]
+        logger.info(f"provisioning {len(wpks)} wpks, {self.concurrency}")
+        results = await asyncio.gather(
+            self.create_known(resolved),
+            *(
+                self.resolve_and_create(chunk)
+                for chunk in si.chunked(lookup_wpks, si.BATCH_SIZE)
+            ),
+        )
+        provisioned = {}
+        for (video_assets, created) in results:
+            mediatailor._video_assets.update(video_assets)
+            provisioned.update(created)
+        mediatailor.record_provisioned(wpks, provisioned)
+
+    async def create_programs(self, programs, previous_program_name=None):
+        # every program is relative to the one before it, so this chain is sequential
+        for program in programs:
+            previous_program_name = await self.call(
+                "create_program",
+                self.mediatailor.create_program,
+                program,
+                previous_program_name,
+            )
+        return previous_program_name
+
+    async def resolve(self, wpks):
+        # batched lookups, all chunks at once
+        video_assets = {}
+        for chunk_assets in await asyncio.gather(
+            *(
+                self.call("video_api", si.resolve_video_assets, chunk)
+                for chunk in si.chunked(wpks, si.BATCH_SIZE)
+            )
+        ):
+            video_assets.update(chunk_assets)
+        return video_assets
+
+    async def run_pipeline(
+        self, programs, previous_program_name=None, lookahead=config.PIPELINE_LOOKAHEAD
+    ):
+        # program N is created as soon as its vod source exists and program N-1 is created,
+        # meanwhile the vod sources of the next `lookahead` programs are created in the background
+        mediatailor = self.mediatailor
+        sources = {}
+        try:
+            for (index, program) in enumerate(programs):
+                for upcoming in programs[index : index + lookahead + 1]:
+                    if upcoming.wpk in sources:
+                        continue
+                    if upcoming.wpk in mediatailor.available_wpks:
+                        sources[upcoming.wpk] = None
+                    else:
+                        sources[upcoming.wpk] = asyncio.create_task(
+                            self.create_vod_source(
+                                mediatailor.get_video_asset(upcoming.wpk)
+                            )
+                        )
+                if sources[program.wpk]:
+                    await sources[program.wpk]
+                    mediatailor.add_wpk_to_available(program.wpk)
+                    sources[program.wpk] = None
+                previous_program_name = await self.call(
+                    "create_program",
+                    mediatailor.create_program,
+                    program,
+                    previous_program_name,
+                )
+        finally:
+            pending = [task for task in sources.values() if task and not task.done()]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        return previous_program_name
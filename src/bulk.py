@@ -0,0 +1,59 @@
+from src import config
+from src import log
+from src import metrics
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import time
+
+logger = log.setup_custom_logger(__name__, loglevel="info")
+logger.debug(f"initiated module: {__name__}")
+
+PROGRESS_INTERVAL_SECONDS = 5
+
+BulkSummary = namedtuple(
+    "BulkSummary", ["name", "total", "succeeded", "failed", "throttled", "seconds"]
+)
+
+
+def format_summary(summary):
+    return (
+        f"{summary.name}: {summary.succeeded}/{summary.total} done, {len(summary.failed)} failed, "
+        f"{summary.throttled} throttled, {summary.seconds:.1f}s"
+    )
+
+
+def run_bulk(name, func, items, max_workers=config.BULK_WORKERS):
+    # calls func(item) for every item in a worker pool. func goes through the
+    # ThrottledClient, which does the rate limiting and retries; `name` is its operation,
+    # the throttles are taken from its metrics
+    items = list(items)
+    run_metrics = metrics.get_metrics()
+    throttled_before = run_metrics.get_count(name, "throttles")
+    started = time.monotonic()
+    last_progress = started
+    succeeded = 0
+    failed = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(func, item): item for item in items}
+        for future in as_completed(futures):
+            try:
+                future.result()
+                succeeded += 1
+            except Exception as error:
+                logger.warning(f"{name} failed for {futures[future]}: {error}")
+                failed.append((futures[future], error))
+            if time.monotonic() - last_progress > PROGRESS_INTERVAL_SECONDS:
+                last_progress = time.monotonic()
+                logger.info(
+                    f"{name}: {succeeded + len(failed)}/{len(items)}, {len(failed)} failed, {run_metrics.get_count(name, 'throttles') - throttled_before} throttled"
+                )
+    summary = BulkSummary(
+        name=name,
+        total=len(items),
+        succeeded=succeeded,
+        failed=failed,
+        throttled=run_metrics.get_count(name, "throttles") - throttled_before,
+        seconds=time.monotonic() - started,
+    )
+    logger.info(format_summary(summary))
+    return summary
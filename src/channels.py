@@ -0,0 +1,189 @@
+from src import config
+from src import inventory
+from src import log
+from src import mediatailor as mt
+from src import playlist_parser as pp
+from src import streaminfo as si
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import glob
+import json
+
+logger = log.setup_custom_logger(__name__, loglevel="info")
+logger.debug(f"initiated module: {__name__}")
+
+
+def get_channel_config(item):
+    # the source locations and slate default to the ones of the default channel, so
+    # channels share the vod source location (and its sources) unless told otherwise
+    return mt.ChannelConfig(
+        name=item["name"],
+        vod_source_location=item.get(
+            "vod_source_location", mt.DEFAULT_CHANNEL.vod_source_location
+        ),
+        ads_source_location=item.get(
+            "ads_source_location", mt.DEFAULT_CHANNEL.ads_source_location
+        ),
+        slate_ad_name=item.get("slate_ad_name", mt.DEFAULT_CHANNEL.slate_ad_name),
+    )
+
+
+def get_inputfiles(patterns):
+    fnames = []
+    for pattern in patterns:
+        fnames.extend(sorted(glob.glob(pattern)) or [pattern])
+    return fnames
+
+
+def load_channels(path, default_inputfiles=()):
+    # json list of {"name", "inputfiles" (paths or globs), and optionally
+    # "vod_source_location", "ads_source_location", "slate_ad_name"}.
+    # Returns [(ChannelConfig, inputfiles)], channels without inputfiles get the default ones
+    with open(path) as f:
+        items = json.load(f)
+    channels = []
+    for item in items:
+        inputfiles = get_inputfiles(item.get("inputfiles", [])) or list(
+            default_inputfiles
+        )
+        if not inputfiles:
+            raise ValueError(f"{path}: no inputfiles for channel {item['name']}")
+        channels.append((get_channel_config(item), inputfiles))
+    names = [channel.name for (channel, _) in channels]
+    if len(set(names)) != len(names):
+        raise ValueError(f"{path}: channel names aren't unique: {names}")
+    return channels
+
+
+class ChannelPlan:
+    def __init__(self, mediatailor, inputfiles) -> None:
+        self.mediatailor = mediatailor
+        self.inputfiles = inputfiles
+        self.playlist = None
+        self.programs = []
+
+    def __repr__(self) -> str:
+        return f"<ChannelPlan {self.mediatailor.channel.name}: {len(self.inputfiles)} files, {len(self.programs)} programs>"
+
+
+class MultiChannelScheduler:
+    # schedules several channels from one process. The MediaTailors share the client (and
+    # so the rate limits of the account), the inventory and the resolved video assets:
+    # the stack is listed once, every wpk is looked up once and a vod source used by
+    # several channels is created once. Channels are provisioned and committed concurrently
+    def __init__(
+        self,
+        client,
+        channels,
+        target_date,
+        last_date=None,
+        use_async=False,
+        get_journal=None,
+        playlist_cache=None,
+        max_workers=config.PROVISION_WORKERS,
+        max_channels=config.CHANNEL_WORKERS,
+    ) -> None:
+        # channels: [(ChannelConfig, inputfiles)], get_journal(channel) -> journal or None
+        self.target_date = target_date
+        self.last_date = last_date
+        self.playlist_cache = playlist_cache
+        self.max_workers = max_workers
+        self.max_channels = max_channels
+        self.inventory = inventory.Inventory(client)
+        self.video_assets = {}
+        self.plans = [
+            ChannelPlan(
+                mt.MediaTailor(
+                    use_async=use_async,
+                    journal=get_journal(channel) if get_journal else None,
+                    client=client,
+                    channel=channel,
+                    inventory=self.inventory,
+                    video_assets=self.video_assets,
+                ),
+                inputfiles,
+            )
+            for (channel, inputfiles) in channels
+        ]
+
+    def __repr__(self) -> str:
+        return f"<MultiChannelScheduler {[plan.mediatailor.channel.name for plan in self.plans]}>"
+
+    def start_validation(self):
+        for plan in self.plans:
+            plan.mediatailor.start_validation()
+
+    def parse(self, jobs=None):
+        # with the playlist cache a file used by several channels is parsed once
+        for plan in self.plans:
+            plan.playlist = pp.PlaylistParser(
+                self.target_date, self.last_date, playlist_cache=self.playlist_cache
+            )
+            plan.playlist.add_xmls(plan.inputfiles, max_workers=jobs)
+            plan.programs = list(plan.playlist.get_parsed_programs())
+            logger.info(f"{plan}")
+
+    def get_unprovisioned_wpks(self):
+        # the union over the channels, in order of first use
+        wpks = []
+        for plan in self.plans:
+            wpks.extend(plan.mediatailor.get_unprovisioned_wpks(plan.programs))
+        return list(dict.fromkeys(wpks))
+
+    def resolve(self):
+        # looks up the wpks of all channels before the channels start provisioning, so a
+        # wpk shared by channels isn't looked up by each of them
+        wpks = [
+            wpk for wpk in self.get_unprovisioned_wpks() if wpk not in self.video_assets
+        ]
+        logger.info(f"resolving {len(wpks)} wpks for {len(self.plans)} channels")
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for video_assets in executor.map(
+                si.resolve_video_assets, si.chunked(wpks, si.BATCH_SIZE)
+            ):
+                self.video_assets.update(video_assets)
+
+    def run_channel(
+        self,
+        plan,
+        force,
+        reconcile=False,
+        pipeline=False,
+        lookahead=config.PIPELINE_LOOKAHEAD,
+    ):
+        mediatailor = plan.mediatailor
+        if pipeline and not reconcile:
+            mediatailor.commit_pipelined(plan.programs, force, lookahead=lookahead)
+            return
+        mediatailor.provision(plan.programs, max_workers=self.max_workers)
+        for program in plan.programs:
+            mediatailor.add_to_schedule(program)
+        logger.info(f"{mediatailor}: {len(mediatailor.schedule)} programs planned")
+        if reconcile:
+            mediatailor.reconcile(
+                force,
+                window_start=plan.playlist.window_start,
+                window_end=plan.playlist.window_end,
+            )
+        else:
+            mediatailor.commit(force, day_windows=plan.playlist.get_day_windows())
+
+    def run(self, force, **kwargs):
+        # provisions and commits (or reconciles) the parsed channels, a failing channel
+        # doesn't stop the others. Returns {channel name: error or None}
+        errors = {}
+        with ThreadPoolExecutor(max_workers=self.max_channels) as executor:
+            runs = {
+                executor.submit(self.run_channel, plan, force, **kwargs): plan
+                for plan in self.plans
+            }
+            for run in as_completed(runs):
+                name = runs[run].mediatailor.channel.name
+                errors[name] = run.exception()
+                if errors[name]:
+                    logger.error(f"{name} failed: {errors[name]!r}")
+                else:
+                    logger.info(f"{name} done")
+        return {
+            plan.mediatailor.channel.name: errors[plan.mediatailor.channel.name]
+            for plan in self.plans
+        }
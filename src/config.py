@@ -2,3 +2,27 @@ VOD_MEDIAPACKAGE_URL = "https://ad66db258d6e0f8a1fef27281b66e016.egress.mediapac
 VOD_CDN = "https://ad66db258d6e0f8a1fef27281b66e016.egress.mediapackage-vod.eu-west-1.amazonaws.com"
 # VOD_CDN = "https://vod.prd1.talpatvcdn.nl"
 ADS_CDN = "https://dsa.tst1.talpatvcdn.nl"
+METADATA_CACHE_FILE = ".cache/video_metadata.sqlite"
+METADATA_CACHE_TTL = 7 * 24 * 60 * 60
+METADATA_CACHE_NEGATIVE_TTL = 60 * 60
+PLAYLIST_CACHE_DIR = ".cache/playlists"
+PROVISION_WORKERS = 8
+CHANNEL_WORKERS = 4
+BULK_WORKERS = 8
+SCHEDULE_SNAPSHOT_SECONDS = 30
+ASYNC_CONCURRENCY = {"video_api": 4, "create_vod_source": 5, "create_program": 1}
+VIDEO_API_POOL_SIZE = 10
+VIDEO_API_TIMEOUT = (3.05, 30)
+VIDEO_API_RETRIES = 3
+PIPELINE_LOOKAHEAD = 8
+JOURNAL_DIR = ".journal"
+MEDIATAILOR_REGION = "eu-west-1"
+MEDIATAILOR_RATE_LIMITS = {"read": 10, "write": 5, "delete": 5}
+MEDIATAILOR_MIN_RATE = 0.5
+MEDIATAILOR_MAX_RETRIES = 6
+OFFLINE_LATENCY = 0.02
+OFFLINE_TPS_LIMITS = {"read": 10, "write": 5, "delete": 5}
+OFFLINE_JOURNAL_DIR = ".journal/offline"
+WATCH_POLL_SECONDS = 2
+WATCH_MAX_RETRY_SECONDS = 5 * 60
+METRICS_DIR = ".metrics"
@@ -0,0 +1,417 @@
+from src import log
+from src import throttle
+from src import utils
+from collections import deque
+import random
+import threading
+import time
+
+logger = log.setup_custom_logger(__name__, loglevel="info")
+logger.debug(f"initiated module: {__name__}")
+
+ACCOUNT_ARN = "arn:aws:mediatailor:eu-west-1:000000000000"
+DEFAULT_SOURCE_DURATION_MS = 25 * 60 * 1000
+DEFAULT_SLATE_DURATION_MS = 190 * 1000
+MAX_PAGE_SIZE = 100
+
+
+def get_client_error(code, operation_name, message=""):
+    from botocore.exceptions import ClientError
+
+    return ClientError(
+        {"Error": {"Code": code, "Message": message}}, operation_name=operation_name
+    )
+
+
+class FakePaginator:
+    # MaxResults/NextToken paging like the boto3 paginators of the list operations
+    def __init__(self, client, operation_name) -> None:
+        self.client = client
+        self.operation_name = operation_name
+
+    def paginate(self, PaginationConfig=None, **kwargs):
+        page_size = (PaginationConfig or {}).get("PageSize")
+        if page_size:
+            kwargs["MaxResults"] = page_size
+        while True:
+            page = getattr(self.client, self.operation_name)(**kwargs)
+            yield page
+            if not page.get("NextToken"):
+                return
+            kwargs["NextToken"] = page["NextToken"]
+
+
+class FakeMediaTailorClient:
+    # in memory stand-in for the boto3 MediaTailor client, only the operations used here.
+    # Calls take `latency` seconds, are throttled above `tps_limits` calls per second per
+    # operation class (and randomly with `throttle_ratio`) and list results come in pages
+    # of at most `page_size` items. Program start times are worked out like channel
+    # assembly does: absolute, or right after the relative program including its adbreaks.
+    def __init__(
+        self,
+        latency=0,
+        tps_limits=None,
+        throttle_ratio=0,
+        page_size=MAX_PAGE_SIZE,
+        get_source_duration_ms=None,
+        slate_duration_ms=DEFAULT_SLATE_DURATION_MS,
+        seed=None,
+    ) -> None:
+        self.latency = latency
+        self.tps_limits = tps_limits or {}
+        self.throttle_ratio = throttle_ratio
+        self.page_size = page_size
+        self._get_source_duration_ms = get_source_duration_ms
+        self.slate_duration_ms = slate_duration_ms
+        self.calls = {}
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+        self._recent_calls = {}
+        self._source_locations = {}
+        self._sources = {}
+        self._channels = {}
+        self._programs = {}
+        self._deleted_programs = {}
+        self._stale_channels = set()
+
+    def __repr__(self) -> str:
+        return f"<FakeMediaTailorClient {len(self._channels)} channels, { {name: len(sources) for (name, sources) in self._sources.items()} } sources, { {name: len(programs) for (name, programs) in self._programs.items()} } programs>"
+
+    @classmethod
+    def with_stack(
+        cls,
+        vod_source_location_name,
+        ads_source_location_name,
+        slate_ad_name,
+        channel_name,
+        **kwargs,
+    ):
+        # a client with the source locations, slate and channel MediaTailor.validate_config wants
+        client = cls(**kwargs)
+        client.add_stack(
+            vod_source_location_name, ads_source_location_name, slate_ad_name, channel_name
+        )
+        return client
+
+    def add_stack(
+        self, vod_source_location_name, ads_source_location_name, slate_ad_name, channel_name
+    ):
+        # the source locations, slate and channel of one more channel, source locations
+        # that are there already (shared by channels) keep their sources
+        with self._lock:
+            for source_location_name in (
+                vod_source_location_name,
+                ads_source_location_name,
+            ):
+                self._source_locations[source_location_name] = {
+                    "Arn": f"{ACCOUNT_ARN}:sourceLocation/{source_location_name}",
+                    "SourceLocationName": source_location_name,
+                }
+                self._sources.setdefault(source_location_name, {})
+            self._sources[ads_source_location_name][slate_ad_name] = {
+                "Arn": f"{ACCOUNT_ARN}:vodSource/{ads_source_location_name}/{slate_ad_name}",
+                "SourceLocationName": ads_source_location_name,
+                "VodSourceName": slate_ad_name,
+            }
+            self._channels[channel_name] = {
+                "Arn": f"{ACCOUNT_ARN}:channel/{channel_name}",
+                "ChannelName": channel_name,
+            }
+            self._programs.setdefault(channel_name, {})
+
+    def _call(self, operation_name):
+        # latency, call counts and throttling of one api call
+        with self._lock:
+            self.calls[operation_name] = self.calls.get(operation_name, 0) + 1
+            operation_class = throttle.get_operation_class(operation_name)
+            limit = self.tps_limits.get(operation_class)
+            recent_calls = self._recent_calls.setdefault(operation_class, deque())
+            now = time.monotonic()
+            while recent_calls and recent_calls[0] <= now - 1:
+                recent_calls.popleft()
+            throttled = (limit and len(recent_calls) >= limit) or (
+                self._random.random() < self.throttle_ratio
+            )
+            if not throttled:
+                recent_calls.append(now)
+        if self.latency:
+            time.sleep(self.latency)
+        if throttled:
+            raise get_client_error("ThrottlingException", operation_name, "Rate exceeded")
+
+    def _get_page(self, items, MaxResults=None, NextToken=None):
+        page_size = min(MaxResults or self.page_size, self.page_size)
+        start = int(NextToken or 0)
+        page = {"Items": items[start : start + page_size]}
+        if start + page_size < len(items):
+            page["NextToken"] = str(start + page_size)
+        return page
+
+    def _get_source_location(self, operation_name, source_location_name):
+        if source_location_name not in self._source_locations:
+            raise get_client_error(
+                "BadRequestException",
+                operation_name,
+                f"source location {source_location_name} not found",
+            )
+        return self._sources[source_location_name]
+
+    def _get_channel_programs(self, operation_name, channel_name):
+        if channel_name not in self._channels:
+            raise get_client_error(
+                "BadRequestException", operation_name, f"channel {channel_name} not found"
+            )
+        return self._programs[channel_name]
+
+    def get_paginator(self, operation_name):
+        return FakePaginator(self, operation_name)
+
+    def create_source_location(self, SourceLocationName, **kwargs):
+        self._call("create_source_location")
+        with self._lock:
+            if SourceLocationName in self._source_locations:
+                raise get_client_error("ConflictException", "create_source_location")
+            self._source_locations[SourceLocationName] = {
+                "Arn": f"{ACCOUNT_ARN}:sourceLocation/{SourceLocationName}",
+                "SourceLocationName": SourceLocationName,
+                **kwargs,
+            }
+            self._sources[SourceLocationName] = {}
+            return dict(self._source_locations[SourceLocationName])
+
+    def delete_source_location(self, SourceLocationName):
+        self._call("delete_source_location")
+        with self._lock:
+            self._get_source_location("delete_source_location", SourceLocationName)
+            del self._source_locations[SourceLocationName]
+            del self._sources[SourceLocationName]
+            return {}
+
+    def list_source_locations(self, **kwargs):
+        self._call("list_source_locations")
+        with self._lock:
+            return self._get_page(list(self._source_locations.values()), **kwargs)
+
+    def create_vod_source(self, SourceLocationName, VodSourceName, **kwargs):
+        self._call("create_vod_source")
+        with self._lock:
+            sources = self._get_source_location("create_vod_source", SourceLocationName)
+            if VodSourceName in sources:
+                raise get_client_error("ConflictException", "create_vod_source")
+            sources[VodSourceName] = {
+                "Arn": f"{ACCOUNT_ARN}:vodSource/{SourceLocationName}/{VodSourceName}",
+                "SourceLocationName": SourceLocationName,
+                "VodSourceName": VodSourceName,
+                **kwargs,
+            }
+            return dict(sources[VodSourceName])
+
+    def delete_vod_source(self, SourceLocationName, VodSourceName):
+        self._call("delete_vod_source")
+        with self._lock:
+            sources = self._get_source_location("delete_vod_source", SourceLocationName)
+            if VodSourceName not in sources:
+                raise get_client_error(
+                    "BadRequestException",
+                    "delete_vod_source",
+                    f"vod source {VodSourceName} not found",
+                )
+            del sources[VodSourceName]
+            return {}
+
+    def list_vod_sources(self, SourceLocationName, **kwargs):
+        self._call("list_vod_sources")
+        with self._lock:
+            sources = self._get_source_location("list_vod_sources", SourceLocationName)
+            return self._get_page(list(sources.values()), **kwargs)
+
+    def create_channel(self, ChannelName, **kwargs):
+        self._call("create_channel")
+        with self._lock:
+            if ChannelName in self._channels:
+                raise get_client_error("ConflictException", "create_channel")
+            self._channels[ChannelName] = {
+                "Arn": f"{ACCOUNT_ARN}:channel/{ChannelName}",
+                "ChannelName": ChannelName,
+                **kwargs,
+            }
+            self._programs[ChannelName] = {}
+            return dict(self._channels[ChannelName])
+
+    def put_channel_policy(self, ChannelName, Policy):
+        self._call("put_channel_policy")
+        with self._lock:
+            self._get_channel_programs("put_channel_policy", ChannelName)
+            return {}
+
+    def list_channels(self, **kwargs):
+        self._call("list_channels")
+        with self._lock:
+            return self._get_page(list(self._channels.values()), **kwargs)
+
+    def _update_starts(self, channel_name):
+        # a relative program starts when the program it follows ends, also when that one
+        # was replaced (recreated under its name) since; a program whose relative program
+        # is gone keeps the start it had. Only recomputed after deletes
+        if channel_name not in self._stale_channels:
+            return
+        programs = self._programs[channel_name]
+        resolved = set()
+        for program_name in programs:
+            chain = []
+            while program_name not in resolved and program_name not in chain:
+                chain.append(program_name)
+                program_name = programs[program_name]["relative_program"]
+                if program_name not in programs:
+                    break
+            for program_name in reversed(chain):
+                program = programs[program_name]
+                relative_program = programs.get(program["relative_program"])
+                if relative_program is not None:
+                    program["start_ms"] = relative_program["end_ms"]
+                program["end_ms"] = program["start_ms"] + program["length_ms"]
+                resolved.add(program_name)
+        self._stale_channels.discard(channel_name)
+
+    def get_source_duration_ms(self, vod_source_name):
+        if self._get_source_duration_ms:
+            return self._get_source_duration_ms(vod_source_name)
+        return DEFAULT_SOURCE_DURATION_MS
+
+    def create_program(
+        self,
+        ChannelName,
+        ProgramName,
+        ScheduleConfiguration,
+        SourceLocationName,
+        VodSourceName,
+        AdBreaks=(),
+    ):
+        self._call("create_program")
+        with self._lock:
+            programs = self._get_channel_programs("create_program", ChannelName)
+            if ProgramName in programs:
+                raise get_client_error("ConflictException", "create_program")
+            sources = self._get_source_location("create_program", SourceLocationName)
+            if VodSourceName not in sources:
+                raise get_client_error(
+                    "BadRequestException",
+                    "create_program",
+                    f"vod source {VodSourceName} not found",
+                )
+            self._update_starts(ChannelName)
+            transition = ScheduleConfiguration["Transition"]
+            if transition["Type"] == "RELATIVE":
+                relative_program = programs.get(transition["RelativeProgram"])
+                if not relative_program:
+                    raise get_client_error(
+                        "BadRequestException",
+                        "create_program",
+                        f"program {transition['RelativeProgram']} not found",
+                    )
+                start_ms = relative_program["end_ms"]
+            else:
+                start_ms = transition["ScheduledStartTimeMillis"]
+            offsets_ms = sorted(adbreak["OffsetMillis"] for adbreak in AdBreaks)
+            duration_ms = self.get_source_duration_ms(VodSourceName)
+            length_ms = duration_ms + len(offsets_ms) * self.slate_duration_ms
+            programs[ProgramName] = {
+                "ProgramName": ProgramName,
+                "SourceLocationName": SourceLocationName,
+                "VodSourceName": VodSourceName,
+                "relative_program": transition.get("RelativeProgram"),
+                "start_ms": start_ms,
+                "duration_ms": duration_ms,
+                "length_ms": length_ms,
+                "offsets_ms": offsets_ms,
+                "end_ms": start_ms + length_ms,
+            }
+            if ProgramName in self._deleted_programs.get(ChannelName, ()):
+                # the programs that followed the deleted one follow this one again
+                self._deleted_programs[ChannelName].discard(ProgramName)
+                self._stale_channels.add(ChannelName)
+            return {
+                "Arn": f"{ACCOUNT_ARN}:program/{ChannelName}/{ProgramName}",
+                "ChannelName": ChannelName,
+                "ProgramName": ProgramName,
+                "ScheduledStartTime": utils.datetime_from_epoch_milliseconds(start_ms),
+            }
+
+    def delete_program(self, ChannelName, ProgramName):
+        self._call("delete_program")
+        with self._lock:
+            programs = self._get_channel_programs("delete_program", ChannelName)
+            if ProgramName not in programs:
+                raise get_client_error(
+                    "BadRequestException",
+                    "delete_program",
+                    f"program {ProgramName} not found",
+                )
+            del programs[ProgramName]
+            self._deleted_programs.setdefault(ChannelName, set()).add(ProgramName)
+            self._stale_channels.add(ChannelName)
+            return {}
+
+    def describe_program(self, ChannelName, ProgramName):
+        self._call("describe_program")
+        with self._lock:
+            programs = self._get_channel_programs("describe_program", ChannelName)
+            self._update_starts(ChannelName)
+            if ProgramName not in programs:
+                raise get_client_error(
+                    "BadRequestException",
+                    "describe_program",
+                    f"program {ProgramName} not found",
+                )
+            program = programs[ProgramName]
+            return {
+                "ChannelName": ChannelName,
+                "ProgramName": ProgramName,
+                "SourceLocationName": program["SourceLocationName"],
+                "VodSourceName": program["VodSourceName"],
+                "AdBreaks": [
+                    {"OffsetMillis": offset_ms} for offset_ms in program["offsets_ms"]
+                ],
+                "ScheduledStartTime": utils.datetime_from_epoch_milliseconds(
+                    program["start_ms"]
+                ),
+                "DurationMillis": program["end_ms"] - program["start_ms"],
+            }
+
+    def get_schedule_entry(self, program):
+        adbreaks = []
+        for (position, offset_ms) in enumerate(program["offsets_ms"]):
+            adbreaks.append(
+                {
+                    "ApproximateStartTime": utils.datetime_from_epoch_milliseconds(
+                        program["start_ms"] + offset_ms + position * self.slate_duration_ms
+                    ),
+                    "ApproximateDurationSeconds": self.slate_duration_ms // 1000,
+                }
+            )
+        return {
+            "ProgramName": program["ProgramName"],
+            "SourceLocationName": program["SourceLocationName"],
+            "VodSourceName": program["VodSourceName"],
+            "ApproximateStartTime": utils.datetime_from_epoch_milliseconds(
+                program["start_ms"]
+            ),
+            "ApproximateDurationSeconds": (program["end_ms"] - program["start_ms"]) // 1000,
+            "ScheduleEntryType": "PROGRAM",
+            "ScheduleAdBreaks": adbreaks,
+        }
+
+    def get_channel_schedule(self, ChannelName, DurationMinutes=None, **kwargs):
+        # the whole schedule by start time: unlike the service, DurationMinutes isn't applied,
+        # so schedules for days in the past can be reconciled offline too
+        self._call("get_channel_schedule")
+        with self._lock:
+            programs = self._get_channel_programs("get_channel_schedule", ChannelName)
+            self._update_starts(ChannelName)
+            entries = [
+                self.get_schedule_entry(program)
+                for program in sorted(
+                    programs.values(), key=lambda program: program["start_ms"]
+                )
+            ]
+            return self._get_page(entries, **kwargs)
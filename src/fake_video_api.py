@@ -0,0 +1,132 @@
+from src import log
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import json
+import threading
+import time
+import zlib
+
+logger = log.setup_custom_logger(__name__, loglevel="info")
+logger.debug(f"initiated module: {__name__}")
+
+HLS_SEGMENT_PATTERN = "/c883bd72608347a89339ec1f2f00caff/eb961633ca3b4ca8b910f99144cd30c4/"
+DASH_SEGMENT_PATTERN = "/88fd84e732ed401ba41634486678683b/b7dfd16bc86c483c9628d33798ac5e4f/"
+STREAM_HOST = "https://vod-ww.prd1.talpa.network"
+MIN_DURATION_SECONDS = 20 * 60
+MAX_DURATION_SECONDS = 50 * 60
+
+
+def get_wpk_hash(wpk):
+    # stable across runs and processes, unlike hash()
+    return zlib.crc32(wpk.encode())
+
+
+def get_duration_seconds(wpk):
+    return MIN_DURATION_SECONDS + get_wpk_hash(wpk) % (
+        MAX_DURATION_SECONDS - MIN_DURATION_SECONDS
+    )
+
+
+def get_duration_milliseconds(wpk):
+    return get_duration_seconds(wpk) * 1000
+
+
+def get_video_item(wpk):
+    # a GetVideoDetails item for `wpk`, made up but the same on every call
+    duration = get_duration_seconds(wpk)
+    return {
+        "guid": wpk,
+        "duration": duration,
+        "slug": f"empty_episode-{wpk.lower()}",
+        "media": [
+            {
+                "cuePoints": [
+                    {"time": duration * part / 4, "title": f"Chapter {part}"}
+                    for part in range(1, 4)
+                ]
+            }
+        ],
+        "availableRegion": "NL",
+        "sources": [
+            {
+                "file": f"{STREAM_HOST}/out/v1{HLS_SEGMENT_PATTERN}{wpk}/index.m3u8?token=stub",
+                "type": "m3u8",
+                "drm": None,
+            },
+            {
+                "file": f"{STREAM_HOST}/out/v1{DASH_SEGMENT_PATTERN}{wpk}/index.mpd?token=stub",
+                "type": "dash",
+                "drm": None,
+            },
+        ],
+    }
+
+
+class VideoApiStub:
+    # the GetVideoDetails query of the video GraphQL api, served from made up items.
+    # Every request takes `latency` seconds; the wpks in `unavailable_wpks` and a stable
+    # `unavailable_ratio` share of the others aren't returned, like unpublished videos
+    def __init__(self, latency=0, unavailable_ratio=0, unavailable_wpks=()) -> None:
+        self.latency = latency
+        self.unavailable_ratio = unavailable_ratio
+        self.unavailable_wpks = set(unavailable_wpks)
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"<VideoApiStub {self.requests} requests>"
+
+    def is_available(self, wpk):
+        if wpk in self.unavailable_wpks:
+            return False
+        return get_wpk_hash(wpk) % 1000 >= self.unavailable_ratio * 1000
+
+    def get_response(self, variables):
+        wpks = [wpk for wpk in variables.get("videoId") or [] if self.is_available(wpk)]
+        skip = variables.get("skip") or 0
+        limit = variables.get("limit") or len(wpks)
+        items = [get_video_item(wpk) for wpk in wpks[skip : skip + limit]]
+        return {"data": {"programs": {"items": items}}}
+
+    def handle(self, query_string):
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        params = parse_qs(query_string)
+        if "GetVideoDetails" not in params.get("query", [""])[0]:
+            return (400, {"errors": [{"message": "only GetVideoDetails is stubbed"}]})
+        variables = json.loads(params.get("variables", ["{}"])[0])
+        return (200, self.get_response(variables))
+
+
+def get_request_handler(stub):
+    class RequestHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real api
+
+        def do_GET(self):
+            (status, response) = stub.handle(urlparse(self.path).query)
+            body = json.dumps(response).encode()
+            self.send_response(status)
+            self.send_header("content-type", "application/json")
+            self.send_header("content-length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    return RequestHandler
+
+
+def start_video_api_stub(host="127.0.0.1", port=0, **kwargs):
+    # serves the stub in a daemon thread, returns (server, graphql url); port 0 picks a free one
+    stub = VideoApiStub(**kwargs)
+    server = ThreadingHTTPServer((host, port), get_request_handler(stub))
+    server.daemon_threads = True
+    server.stub = stub
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    (host, port) = server.server_address[:2]
+    url = f"http://{host}:{port}/graphql"
+    logger.info(f"video api stub at {url}")
+    return (server, url)
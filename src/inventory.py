@@ -0,0 +1,119 @@
+from src import log
+from concurrent.futures import Future
+import threading
+
+logger = log.setup_custom_logger(__name__, loglevel="info")
+logger.debug(f"initiated module: {__name__}")
+
+
+def iter_items(client, operation_name, **kwargs):
+    # all pages of a MediaTailor list operation
+    for page in client.get_paginator(operation_name).paginate(**kwargs):
+        yield from page["Items"]
+
+
+class Inventory:
+    # source locations, vod sources and channels, each listed (all pages) once on first use
+    # and updated in place by the creates/deletes done through this process
+    def __init__(self, client) -> None:
+        self.client = client
+        self._lock = threading.RLock()
+        self._source_locations = None
+        self._sources = {}
+        self._channels = None
+        self._provisioning = {}
+
+    def __repr__(self) -> str:
+        return f"<Inventory locations={self._source_locations and list(self._source_locations)} sources={ {name: len(sources) for (name, sources) in self._sources.items()} }>"
+
+    def refresh(self):
+        with self._lock:
+            self._source_locations = None
+            self._sources = {}
+            self._channels = None
+
+    @property
+    def source_locations(self):
+        with self._lock:
+            if self._source_locations is None:
+                self._source_locations = {
+                    source_location["SourceLocationName"]: source_location
+                    for source_location in iter_items(
+                        self.client, "list_source_locations"
+                    )
+                }
+                logger.debug(f"{list(self._source_locations)=}")
+            return self._source_locations
+
+    def source_names(self, source_location_name):
+        # the (live) set of vod source names in a source location
+        with self._lock:
+            if source_location_name not in self._sources:
+                self._sources[source_location_name] = {
+                    source["VodSourceName"]
+                    for source in iter_items(
+                        self.client,
+                        "list_vod_sources",
+                        SourceLocationName=source_location_name,
+                    )
+                }
+                logger.info(
+                    f"{source_location_name}: {len(self._sources[source_location_name])} vod sources"
+                )
+            return self._sources[source_location_name]
+
+    @property
+    def channels(self):
+        with self._lock:
+            if self._channels is None:
+                self._channels = {
+                    channel["ChannelName"]: channel
+                    for channel in iter_items(self.client, "list_channels")
+                }
+            return self._channels
+
+    def has_source_location(self, source_location_name):
+        return source_location_name in self.source_locations
+
+    def has_source(self, source_location_name, source_name):
+        return source_name in self.source_names(source_location_name)
+
+    def get_channel(self, channel_name):
+        return self.channels.get(channel_name)
+
+    def add_source(self, source_location_name, source_name):
+        with self._lock:
+            self.source_names(source_location_name).add(source_name)
+
+    def remove_source(self, source_location_name, source_name):
+        with self._lock:
+            self.source_names(source_location_name).discard(source_name)
+
+    def provision_source(self, source_location_name, source_name, create):
+        # create(): the call that creates the source. Runs once per source, when it isn't
+        # there yet; concurrent callers for the same source (e.g. channels sharing a
+        # source location) wait for that call instead of making their own
+        key = (source_location_name, source_name)
+        with self._lock:
+            if self.has_source(source_location_name, source_name):
+                return
+            in_flight = self._provisioning.get(key)
+            if in_flight is None:
+                in_flight = self._provisioning[key] = Future()
+                owner = True
+            else:
+                owner = False
+        if not owner:
+            in_flight.result()
+            return
+        try:
+            create()
+        except BaseException as error:
+            in_flight.set_exception(error)
+            raise
+        else:
+            self.add_source(source_location_name, source_name)
+            in_flight.set_result(None)
+        finally:
+            with self._lock:
+                del self._provisioning[key]
@@ -0,0 +1,67 @@
+from src import log
+import json
+import os
+import threading
+import time
+
+logger = log.setup_custom_logger(__name__, loglevel="info")
+logger.debug(f"initiated module: {__name__}")
+
+PLANNED = "planned"
+CONFIRMED = "confirmed"
+
+
+class Journal:
+    # write-ahead log of create calls, one json line per planned/confirmed call.
+    # A call that is planned but not confirmed may or may not have reached MediaTailor
+    def __init__(self, path, resume=False) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._states = {}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if resume:
+            self.load()
+        self._file = open(path, "a" if resume else "w")
+
+    def __repr__(self) -> str:
+        return f"<Journal {self.path} {len(self._states)} entries>"
+
+    def load(self):
+        if not os.path.exists(self.path):
+            logger.info(f"nothing to resume, {self.path} does not exist")
+            return
+        with open(self.path) as journal_file:
+            for line in journal_file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # the last line of an interrupted run might be incomplete
+                    continue
+                self._states[(entry["op"], entry["name"])] = entry["state"]
+        confirmed = sum(state == CONFIRMED for state in self._states.values())
+        logger.info(f"resuming from {self.path}: {confirmed} confirmed calls")
+
+    def write(self, op, name, state, **details):
+        entry = dict(op=op, name=name, state=state, at=time.time(), **details)
+        with self._lock:
+            self._states[(op, name)] = state
+            self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def planned(self, op, name, **details):
+        self.write(op, name, PLANNED, **details)
+
+    def confirmed(self, op, name, **details):
+        self.write(op, name, CONFIRMED, **details)
+
+    def is_planned(self, op, name):
+        return self._states.get((op, name)) == PLANNED
+
+    def is_confirmed(self, op, name):
+        return self._states.get((op, name)) == CONFIRMED
+
+    def close(self):
+        self._file.close()
@@ -1,17 +1,43 @@
+from src import async_engine
+from src import bulk
 from src import config
+from src import fake_mediatailor
+from src import inventory
 from src import log
 from src import streaminfo as si
+from src import throttle
 from src import utils
-import boto3
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import json
+import threading
+import time
 
 logger = log.setup_custom_logger(__name__, loglevel="info")
-logger.info(f"initiated module: {__name__}")
+logger.debug(f"initiated module: {__name__}")
 
 VOD_SOURCE_LOCATION_ID = "VOD"
 ADS_SOURCE_LOCATION_ID = "ADS"
 SLATE_AD_NAME = "sbs6_classics_rondloper_180s"
 CHANNEL_NAME = "SBS6ClassicsVod"
+RECONCILE_TOLERANCE_MILLISECONDS = 1000
+# how far relative programs may have drifted past the end of a reconcile window
+RECONCILE_DRIFT_MINUTES = 24 * 60
+# how far ahead the schedules of other channels are checked for shared vod sources
+SOURCES_IN_USE_MINUTES = 14 * 24 * 60
+SCHEDULE_PAGE_SIZE = 100
+
+# the channel and the source locations/slate its programs use
+ChannelConfig = namedtuple(
+    "ChannelConfig",
+    ["name", "vod_source_location", "ads_source_location", "slate_ad_name"],
+)
+DEFAULT_CHANNEL = ChannelConfig(
+    name=CHANNEL_NAME,
+    vod_source_location=VOD_SOURCE_LOCATION_ID,
+    ads_source_location=ADS_SOURCE_LOCATION_ID,
+    slate_ad_name=SLATE_AD_NAME,
+)
 
 
 def get_slate_config(slate_name):
@@ -42,23 +68,25 @@ class StackConfigIncompleteExeption(Exception):
         return f"<StackConfigIncompleteExeption. Running with `create_stack=True` might fix this! Currently -> {self.message}>"
 
 
-def get_adbreak_config(breakpoint_seconds):
-    logger.info(f"creating breakpoint at {breakpoint_seconds}")
+def get_adbreak_config(breakpoint_milliseconds, channel=DEFAULT_CHANNEL):
+    logger.info(f"creating breakpoint at {breakpoint_milliseconds / 1000}")
 
     return {
         "MessageType": "SPLICE_INSERT",
-        "OffsetMillis": int(breakpoint_seconds * 1000),
+        "OffsetMillis": breakpoint_milliseconds,
         "Slate": {
-            "SourceLocationName": ADS_SOURCE_LOCATION_ID,
-            "VodSourceName": SLATE_AD_NAME,
+            "SourceLocationName": channel.ads_source_location,
+            "VodSourceName": channel.slate_ad_name,
         },
     }
 
 
-def get_chapters_config(chapters):
+def get_chapters_config(chapter_offsets_ms, channel=DEFAULT_CHANNEL):
     AdBreaks = []
-    for chapter in chapters:
-        AdBreaks.append(get_adbreak_config(breakpoint_seconds=chapter.media_starttime))
+    for chapter_offset_ms in chapter_offsets_ms:
+        AdBreaks.append(
+            get_adbreak_config(breakpoint_milliseconds=chapter_offset_ms, channel=channel)
+        )
     return AdBreaks
 
 
@@ -90,68 +118,233 @@ def get_schedule_config(previous_program_name, program_start_milliseconds):
 
 
 def schedule_program(
-    client, wpk, program_name, program_start, chapters, previous_program_name
+    client,
+    wpk,
+    program_name,
+    program_start_milliseconds,
+    chapter_offsets_ms,
+    previous_program_name,
+    channel=DEFAULT_CHANNEL,
 ):
-    program_start_milliseconds = utils.get_epoch_timestamp_milliseconds(program_start)
     schedule_config = get_schedule_config(
         previous_program_name, program_start_milliseconds
     )
     return client.create_program(
-        AdBreaks=get_chapters_config(chapters),
-        ChannelName=CHANNEL_NAME,
+        AdBreaks=get_chapters_config(chapter_offsets_ms, channel=channel),
+        ChannelName=channel.name,
         ProgramName=program_name,
         ScheduleConfiguration=schedule_config,
-        SourceLocationName=VOD_SOURCE_LOCATION_ID,
+        SourceLocationName=channel.vod_source_location,
         VodSourceName=wpk,
     )
 
 
-def get_schedule(client):
-    scheduled_programs = []
-    result = client.get_channel_schedule(
-        ChannelName=CHANNEL_NAME,
-        DurationMinutes=str(24 * 60),
-        MaxResults=3,
+def get_program_name(wpk, program_start_milliseconds):
+    return f"{wpk}-{program_start_milliseconds}"
+
+
+def iter_schedule(client, duration_minutes=24 * 60, channel=DEFAULT_CHANNEL):
+    # streams the schedule page by page. The api has no start time, only a duration from
+    # now, so the pages can't be fetched in parallel; use the largest page size instead
+    return inventory.iter_items(
+        client,
+        "get_channel_schedule",
+        ChannelName=channel.name,
+        DurationMinutes=str(duration_minutes),
+        PaginationConfig={"PageSize": SCHEDULE_PAGE_SIZE},
     )
-    scheduled_programs += result["Items"]
-    next_token = result.get("NextToken", None)
-    logger.info(next_token)
-    while next_token:
-        result = client.get_channel_schedule(
-            ChannelName=CHANNEL_NAME,
-            DurationMinutes=str(24 * 60),
-            MaxResults=10,
-            NextToken=next_token,
-        )
-        next_token = result.get("NextToken", None)
-        scheduled_programs += result["Items"]
-    return scheduled_programs
 
 
-def delete_scheduled_program(client, program_name):
-    return client.delete_program(ChannelName=CHANNEL_NAME, ProgramName=program_name)
+def get_schedule(client, duration_minutes=24 * 60, channel=DEFAULT_CHANNEL):
+    return list(iter_schedule(client, duration_minutes, channel=channel))
 
 
-def delete_all_scheduled_programs(client):
-    for scheduled_program in get_schedule(client):
-        delete_scheduled_program(client, scheduled_program["ProgramName"])
+def delete_scheduled_program(client, program_name, channel=DEFAULT_CHANNEL):
+    return client.delete_program(ChannelName=channel.name, ProgramName=program_name)
 
 
-def get_scheduled_wpks(client):
-    for scheduled_program in get_schedule(client):
+def delete_all_scheduled_programs(
+    client, scheduled_programs=None, channel=DEFAULT_CHANNEL
+):
+    if scheduled_programs is None:
+        scheduled_programs = iter_schedule(client, channel=channel)
+    return bulk.run_bulk(
+        "delete_program",
+        lambda program_name: delete_scheduled_program(client, program_name, channel),
+        [
+            scheduled_program["ProgramName"]
+            for scheduled_program in scheduled_programs
+            if is_scheduled_program(scheduled_program)
+        ],
+    )
+
+
+def get_scheduled_wpks(client, channel=DEFAULT_CHANNEL):
+    for scheduled_program in iter_schedule(client, channel=channel):
         yield scheduled_program["VodSourceName"]
 
 
-def get_program_info(client, wpk):
-    return client.describe_program(ChannelName=CHANNEL_NAME, ProgramName=wpk)
+def get_sources_in_use(client, source_location_name, channel_names):
+    # the vod sources of a source location the schedules of these channels refer to
+    in_use = set()
+    for channel_name in channel_names:
+        for scheduled_program in iter_schedule(
+            client,
+            duration_minutes=SOURCES_IN_USE_MINUTES,
+            channel=DEFAULT_CHANNEL._replace(name=channel_name),
+        ):
+            if (
+                is_scheduled_program(scheduled_program)
+                and scheduled_program["SourceLocationName"] == source_location_name
+            ):
+                in_use.add(scheduled_program["VodSourceName"])
+    return in_use
+
+
+def is_scheduled_program(scheduled_program):
+    return scheduled_program.get("ScheduleEntryType", "PROGRAM") == "PROGRAM"
+
+
+def get_planned_fingerprint(program):
+    return (
+        program.wpk,
+        program.start_ms,
+        program.chapter_offsets_ms,
+    )
+
+
+def get_planned_start_milliseconds(scheduled_program):
+    # the playlist start of a program created here is in its name (get_program_name), the
+    # ApproximateStartTime of a relative program drifts from it
+    (_, _, start) = scheduled_program["ProgramName"].rpartition("-")
+    if start.isdigit():
+        return int(start)
+    return utils.get_epoch_timestamp_milliseconds(
+        scheduled_program["ApproximateStartTime"]
+    )
+
+
+def get_scheduled_fingerprint(scheduled_program):
+    # the schedule only has wall clock times for adbreaks, take off the slates before it to get the media offset
+    program_start = utils.get_epoch_timestamp_milliseconds(
+        scheduled_program["ApproximateStartTime"]
+    )
+    adbreaks = sorted(
+        scheduled_program.get("ScheduleAdBreaks", []),
+        key=lambda adbreak: adbreak["ApproximateStartTime"],
+    )
+    offsets = []
+    slate_milliseconds = 0
+    for adbreak in adbreaks:
+        adbreak_start = utils.get_epoch_timestamp_milliseconds(
+            adbreak["ApproximateStartTime"]
+        )
+        offsets.append(adbreak_start - program_start - slate_milliseconds)
+        slate_milliseconds += int(adbreak["ApproximateDurationSeconds"] * 1000)
+    return (
+        scheduled_program["VodSourceName"],
+        get_planned_start_milliseconds(scheduled_program),
+        offsets,
+    )
+
+
+def is_matching_fingerprint(planned, scheduled, compare_start=True):
+    # the programs after the head of a window start when the previous one ends: those
+    # match on wpk and adbreak offsets, the head also on its playlist start
+    (planned_wpk, planned_start, planned_offsets) = planned
+    (scheduled_wpk, scheduled_start, scheduled_offsets) = scheduled
+    return (
+        planned_wpk == scheduled_wpk
+        and (
+            not compare_start
+            or abs(planned_start - scheduled_start) <= RECONCILE_TOLERANCE_MILLISECONDS
+        )
+        and len(planned_offsets) == len(scheduled_offsets)
+        and all(
+            abs(planned_offset - scheduled_offset) <= RECONCILE_TOLERANCE_MILLISECONDS
+            for (planned_offset, scheduled_offset) in zip(
+                planned_offsets, scheduled_offsets
+            )
+        )
+    )
+
+
+def get_reconcile_plan(planned, scheduled):
+    # keep the matching head and tail of the schedule, replace everything in between.
+    # Returns (kept head, deletes, creates, kept tail)
+    planned_fingerprints = [get_planned_fingerprint(program) for program in planned]
+    scheduled_fingerprints = [
+        get_scheduled_fingerprint(scheduled_program) for scheduled_program in scheduled
+    ]
+    shortest = min(len(planned), len(scheduled))
+    prefix = 0
+    while prefix < shortest and is_matching_fingerprint(
+        planned_fingerprints[prefix],
+        scheduled_fingerprints[prefix],
+        compare_start=prefix == 0,
+    ):
+        prefix += 1
+    suffix = 0
+    while suffix < shortest - prefix and is_matching_fingerprint(
+        planned_fingerprints[-1 - suffix],
+        scheduled_fingerprints[-1 - suffix],
+        compare_start=suffix + 1 in (len(planned), len(scheduled)),
+    ):
+        suffix += 1
+    return (
+        scheduled[:prefix],
+        scheduled[prefix : len(scheduled) - suffix],
+        planned[prefix : len(planned) - suffix],
+        scheduled[len(scheduled) - suffix :],
+    )
+
+
+def get_program_info(client, wpk, channel=DEFAULT_CHANNEL):
+    return client.describe_program(ChannelName=channel.name, ProgramName=wpk)
+
+
+def get_throttled_client(client):
+    # retries are done by the ThrottledClient, which also adapts the call rate
+    return throttle.ThrottledClient(
+        client,
+        rate_limits=config.MEDIATAILOR_RATE_LIMITS,
+        min_rate=config.MEDIATAILOR_MIN_RATE,
+        max_retries=config.MEDIATAILOR_MAX_RETRIES,
+    )
 
 
 def get_boto_client():
-    return boto3.client("mediatailor", region_name="eu-west-1")
+    # boto3 takes a while to import, only pay for it when a client is needed
+    import boto3
+    import botocore.config
+
+    return get_throttled_client(
+        boto3.client(
+            "mediatailor",
+            region_name=config.MEDIATAILOR_REGION,
+            # the ThrottledClient retries throttling, server and connection errors
+            config=botocore.config.Config(
+                retries={"mode": "standard", "max_attempts": 1}
+            ),
+        )
+    )
+
+
+def get_offline_client(channels=(DEFAULT_CHANNEL,), **kwargs):
+    # in memory MediaTailor with the source locations, slates and channels already there
+    client = fake_mediatailor.FakeMediaTailorClient(**kwargs)
+    for channel in channels:
+        client.add_stack(
+            vod_source_location_name=channel.vod_source_location,
+            ads_source_location_name=channel.ads_source_location,
+            slate_ad_name=channel.slate_ad_name,
+            channel_name=channel.name,
+        )
+    return get_throttled_client(client)
 
 
 def find_source_location_name_by_id(client, source_location_id):
-    for source_location in client.list_source_locations()["Items"]:
+    for source_location in inventory.iter_items(client, "list_source_locations"):
         logger.debug(f"{source_location=}")
         if source_location["SourceLocationName"] == source_location_id:
             return source_location["SourceLocationName"]
@@ -161,22 +354,22 @@ def delete_source_location_by_name(client, source_location_id):
     return client.delete_source_location(SourceLocationName=source_location_id)
 
 
-def create_vod_source_location(client):
+def create_vod_source_location(client, channel=DEFAULT_CHANNEL):
     # Create Source Location VOD
     return client.create_source_location(
         DefaultSegmentDeliveryConfiguration={"BaseUrl": config.VOD_CDN},
         HttpConfiguration={"BaseUrl": config.VOD_MEDIAPACKAGE_URL},
-        SourceLocationName=VOD_SOURCE_LOCATION_ID,
+        SourceLocationName=channel.vod_source_location,
         # Tags={"string": "string"},
     )
 
 
-def create_ads_source_location(client):
+def create_ads_source_location(client, channel=DEFAULT_CHANNEL):
     # Create Source Location ADS
     return client.create_source_location(
         DefaultSegmentDeliveryConfiguration={"BaseUrl": config.ADS_CDN},
         HttpConfiguration={"BaseUrl": config.ADS_CDN},
-        SourceLocationName=ADS_SOURCE_LOCATION_ID,
+        SourceLocationName=channel.ads_source_location,
         # Tags={"string": "string"},
     )
 
@@ -193,62 +386,62 @@ def create_source(client, hls_url, dash_url, source_location_name, source_name):
     )
 
 
-def create_vod_item(client, wpk, hls_url, dash_url):
+def create_vod_item(client, wpk, hls_url, dash_url, channel=DEFAULT_CHANNEL):
     return create_source(
         client=client,
         source_name=wpk,
         hls_url=hls_url,
         dash_url=dash_url,
-        source_location_name=VOD_SOURCE_LOCATION_ID,
+        source_location_name=channel.vod_source_location,
     )
 
 
-def delete_vod_item(client, wpk):
+def delete_vod_item(client, wpk, channel=DEFAULT_CHANNEL):
     return client.delete_vod_source(
-        SourceLocationName=VOD_SOURCE_LOCATION_ID, VodSourceName=wpk
+        SourceLocationName=channel.vod_source_location, VodSourceName=wpk
     )
 
 
-def create_slate_ad(client):
-    slate_config = get_slate_config(SLATE_AD_NAME)
+def create_slate_ad(client, channel=DEFAULT_CHANNEL):
+    slate_config = get_slate_config(channel.slate_ad_name)
 
     return create_source(
         client=client,
         hls_url=slate_config["hls_url"],
         dash_url=slate_config["dash_url"],
-        source_location_name=ADS_SOURCE_LOCATION_ID,
-        source_name=SLATE_AD_NAME,
+        source_location_name=channel.ads_source_location,
+        source_name=channel.slate_ad_name,
     )
 
 
 def list_source_names_by_location_id(client, source_location_name):
     return [
         source["VodSourceName"]
-        for source in client.list_vod_sources(SourceLocationName=source_location_name)[
-            "Items"
-        ]
+        for source in inventory.iter_items(
+            client, "list_vod_sources", SourceLocationName=source_location_name
+        )
     ]
 
 
-def list_vod_wpks(client):
+def list_vod_wpks(client, channel=DEFAULT_CHANNEL):
     return list_source_names_by_location_id(
-        client=client, source_location_name=VOD_SOURCE_LOCATION_ID
+        client=client, source_location_name=channel.vod_source_location
     )
 
 
-def list_ads_names(client):
+def list_ads_names(client, channel=DEFAULT_CHANNEL):
     return list_source_names_by_location_id(
-        client=client, source_location_name=ADS_SOURCE_LOCATION_ID
+        client=client, source_location_name=channel.ads_source_location
     )
 
 
-def create_channel(client):
+def create_channel(client, channel=DEFAULT_CHANNEL):
     # Create Channel
     response = client.create_channel(
-        ChannelName=CHANNEL_NAME,
+        ChannelName=channel.name,
         FillerSlate={
-            "SourceLocationName": ADS_SOURCE_LOCATION_ID,
-            "VodSourceName": SLATE_AD_NAME,
+            "SourceLocationName": channel.ads_source_location,
+            "VodSourceName": channel.slate_ad_name,
         },
         Outputs=[
             {
@@ -273,7 +466,7 @@ def create_channel(client):
     )
     logger.info(response)
     client.put_channel_policy(
-        ChannelName=CHANNEL_NAME,
+        ChannelName=channel.name,
         Policy=json.dumps(
             {
                 "Version": "2012-10-17",
@@ -291,25 +484,42 @@ def create_channel(client):
     )
 
 
-def get_channel_by_channelname(client):
-    channels = client.list_channels()["Items"]
-    for channel in channels:
-        if channel["ChannelName"] == CHANNEL_NAME:
-            return channel
+def get_channel_by_channelname(client, channel=DEFAULT_CHANNEL):
+    for listed_channel in inventory.iter_items(client, "list_channels"):
+        if listed_channel["ChannelName"] == channel.name:
+            return listed_channel
 
 
 class MediaTailor:
-    def __init__(self, create_stack=False) -> None:
-        self._boto_client = None
-        self._available_wpks = set()
+    def __init__(
+        self,
+        create_stack=False,
+        use_async=False,
+        journal=None,
+        client=None,
+        channel=DEFAULT_CHANNEL,
+        inventory=None,
+        video_assets=None,
+    ) -> None:
+        # client: a (throttled) MediaTailor client to use instead of the boto3 one.
+        # inventory/video_assets: shared between the MediaTailors of several channels
+        self.use_async = use_async
+        self.journal = journal
+        self.channel = channel
+        self._boto_client = client
+        self._inventory = inventory
+        self._async_engine = None
+        self._schedule_snapshot = None
         self._unavailable_wpks = []
         self._program_schedule = []
+        self._video_assets = {} if video_assets is None else video_assets
+        self._validation = None
+        self._validation_lock = threading.Lock()
         if create_stack:
             self.create_stack_components()
-        self.validate_config()
 
     def __repr__(self) -> str:
-        return f"<MediaTailor for {CHANNEL_NAME}>"
+        return f"<MediaTailor for {self.channel.name}>"
 
     @property
     def client(self):
@@ -317,23 +527,62 @@ class MediaTailor:
             self._boto_client = get_boto_client()
         return self._boto_client
 
+    @property
+    def async_engine(self):
+        if not self._async_engine:
+            self._async_engine = async_engine.AsyncEngine(self)
+        return self._async_engine
+
+    @property
+    def inventory(self):
+        if not self._inventory:
+            self._inventory = inventory.Inventory(self.client)
+        return self._inventory
+
     def delete_scheduled_programs(self):
-        delete_all_scheduled_programs(client=self.client)
+        self.ensure_valid()
+        summary = delete_all_scheduled_programs(
+            client=self.client,
+            scheduled_programs=self.active_schedule(),
+            channel=self.channel,
+        )
+        self._schedule_snapshot = None
+        return summary
 
     def remove_vod_content(self):
-        self.delete_scheduled_programs()
+        # programs refer to vod sources, so they have to be gone before the sources
+        summary = self.delete_scheduled_programs()
+        if summary.failed:
+            logger.warning(f"not deleting vod sources, {bulk.format_summary(summary)}")
+            return
         self.delete_all_provisioned_vod_items()
 
     def create_stack_components(self):
-        create_vod_source_location(self.client)
-        create_ads_source_location(self.client)
-        create_slate_ad(self.client)
-        create_channel(self.client)
+        create_vod_source_location(self.client, self.channel)
+        create_ads_source_location(self.client, self.channel)
+        create_slate_ad(self.client, self.channel)
+        create_channel(self.client, self.channel)
+        self.inventory.refresh()
+
+    def start_validation(self):
+        # validate_config in the background (e.g. while the playlists are parsed), returns its future
+        with self._validation_lock:
+            if not self._validation:
+                executor = ThreadPoolExecutor(max_workers=1)
+                self._validation = executor.submit(self.validate_config)
+                executor.shutdown(wait=False)
+            return self._validation
+
+    def ensure_valid(self):
+        # the stack is validated once, before the first call that lists or changes the
+        # vod sources or programs (it only overlaps with parsing the playlists);
+        # raises StackConfigIncompleteExeption on every call when it is incomplete
+        self.start_validation().result()
 
     def validate_config(self):
         has_vod_source = self.vod_source_name
         has_ads_source = self.ads_source_name
-        has_slate_ad = self.has_slate_ad
+        has_slate_ad = has_ads_source and self.has_slate_ad
         has_channel_name = self.channel_name
         ok = all([has_vod_source, has_ads_source, has_slate_ad, has_channel_name])
         if not ok:
@@ -343,54 +592,139 @@ class MediaTailor:
 
     @property
     def vod_source_name(self):
-        return find_source_location_name_by_id(self.client, VOD_SOURCE_LOCATION_ID)
+        if self.inventory.has_source_location(self.channel.vod_source_location):
+            return self.channel.vod_source_location
 
     @property
     def ads_source_name(self):
-        return find_source_location_name_by_id(self.client, ADS_SOURCE_LOCATION_ID)
+        if self.inventory.has_source_location(self.channel.ads_source_location):
+            return self.channel.ads_source_location
 
     @property
     def has_slate_ad(self):
-        logger.debug(list_ads_names(self.client))
-        return SLATE_AD_NAME in list_ads_names(self.client)
+        return self.inventory.has_source(
+            self.channel.ads_source_location, self.channel.slate_ad_name
+        )
 
     @property
     def channel_name(self):
-        return get_channel_by_channelname(self.client)["ChannelName"]
+        channel = self.inventory.get_channel(self.channel.name)
+        return channel["ChannelName"] if channel else None
 
     def add_wpk_to_unavailable(self, wpk):
         # self._unavailable_wpks.add(wpk)
         self._unavailable_wpks.append(wpk)
 
     def add_wpk_to_available(self, wpk):
-        self._available_wpks.add(wpk)
+        self.inventory.add_source(self.channel.vod_source_location, wpk)
 
     @property
     def available_wpks(self):
-        if not self._available_wpks:
-            self._available_wpks.update(list_vod_wpks(self.client))
-        return self._available_wpks
+        # listing the vod sources of a missing source location would fail with a ClientError
+        self.ensure_valid()
+        return self.inventory.source_names(self.channel.vod_source_location)
+
+    def get_video_asset(self, wpk):
+        if wpk not in self._video_assets:
+            self._video_assets[wpk] = si.VideoAsset(wpk=wpk)
+        return self._video_assets[wpk]
+
+    def get_unprovisioned_wpks(self, programs):
+        now_ms = utils.get_UTC_now_milliseconds()
+        wpks = [
+            program.wpk
+            for program in programs
+            if program.start_ms >= now_ms and program.wpk not in self.available_wpks
+        ]
+        return list(dict.fromkeys(wpks))
+
+    def record_provisioned(self, wpks, provisioned):
+        # bookkeeping in the original wpk order, provisioned: {wpk: vod source created}
+        for wpk in wpks:
+            if provisioned[wpk]:
+                self.add_wpk_to_available(wpk)
+            else:
+                self.add_wpk_to_unavailable((wpk, "is not available!"))
+
+    def provision(self, programs, max_workers=config.PROVISION_WORKERS):
+        # lookups and vod source creation in a bounded thread pool, bookkeeping in this thread
+        self.ensure_valid()
+        if self.use_async:
+            self.async_engine.run(self.async_engine.provision(programs))
+            return
+        wpks = self.get_unprovisioned_wpks(programs)
+        lookup_wpks = [wpk for wpk in wpks if wpk not in self._video_assets]
+        logger.info(f"provisioning {len(wpks)} wpks with {max_workers} workers")
+        provisioned = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            lookups = [
+                executor.submit(si.resolve_video_assets, chunk)
+                for chunk in si.chunked(lookup_wpks, si.BATCH_SIZE)
+            ]
+            for wpk in wpks:
+                if wpk in self._video_assets:  # already resolved by an earlier lookup
+                    provisioned[wpk] = executor.submit(
+                        self.create_vod_source, self._video_assets[wpk]
+                    )
+            for lookup in as_completed(lookups):
+                for (wpk, video_asset) in lookup.result().items():
+                    self._video_assets[wpk] = video_asset
+                    provisioned[wpk] = executor.submit(
+                        self.create_vod_source, video_asset
+                    )
+            self.record_provisioned(
+                wpks, {wpk: provisioned[wpk].result() for wpk in wpks}
+            )
 
     def add_to_schedule(self, program):
-        if program.program_start < utils.get_UTC_now():
+        if program.start_ms < utils.get_UTC_now_milliseconds():
             logger.info(f"starts in the past: {program.program_start}")
             return
         if self.is_provisioned(program):
-            if program.program_start < utils.get_UTC_now():
+            if program.start_ms < utils.get_UTC_now_milliseconds():
                 self.add_wpk_to_unavailable(
                     (program.wpk, f"starts in the past: {program.program_start}")
                 )
             else:
                 self._program_schedule.append(program)
 
-    def active_schedule(self):
-        return get_schedule(self.client)
+    def active_schedule(self, duration_minutes=24 * 60):
+        # short lived snapshot shared by reconcile/delete, dropped once programs change
+        now = time.monotonic()
+        if self._schedule_snapshot:
+            (fetched_at, snapshot_minutes, scheduled_programs) = self._schedule_snapshot
+            if (
+                now - fetched_at < config.SCHEDULE_SNAPSHOT_SECONDS
+                and snapshot_minutes >= duration_minutes
+            ):
+                until = utils.get_UTC_now() + utils.seconds_to_timedelta(
+                    duration_minutes * 60
+                )
+                return [
+                    scheduled_program
+                    for scheduled_program in scheduled_programs
+                    if scheduled_program["ApproximateStartTime"] < until
+                ]
+        scheduled_programs = get_schedule(
+            self.client, duration_minutes=duration_minutes, channel=self.channel
+        )
+        self._schedule_snapshot = (now, duration_minutes, scheduled_programs)
+        return scheduled_programs
 
     @property
     def schedule(self):
         return self._program_schedule
 
-    def commit(self, force):
+    def reset_schedule(self):
+        # plan again from scratch, the inventory and the resolved video assets are kept.
+        # Unavailable wpks are looked up again (the metadata cache applies its negative ttl)
+        self._program_schedule = []
+        self._unavailable_wpks = []
+        for (wpk, video_asset) in list(self._video_assets.items()):
+            if not video_asset.is_available:
+                del self._video_assets[wpk]
+
+    def can_commit(self, force):
         if self._unavailable_wpks:
             for unavailable in self._unavailable_wpks:
                 print(unavailable)
@@ -400,44 +734,279 @@ class MediaTailor:
                 print(
                     f"\n Exit.. due to above issues.. use the force (-f) to overrule!"
                 )
-                return
-        previous_program_name = None
-        item_counter = 0
-        for program in self.schedule:
-            item_counter += 1
-            program_name = f"{program.wpk}-{item_counter}"
-            logger.info(f"{program_name=}")
-            schedule_program(
+                return False
+        return True
+
+    def journaled(self, op, name, func, **details):
+        # skips calls confirmed by an earlier run, a call that was planned but not
+        # confirmed might have succeeded before the interruption: a conflict means it did
+        self.ensure_valid()
+        if not self.journal:
+            return func()
+        if self.journal.is_confirmed(op, name):
+            logger.info(f"{op} {name} already done, skipping")
+            return None
+        was_planned = self.journal.is_planned(op, name)
+        self.journal.planned(op, name, **details)
+        try:
+            response = func()
+        except Exception as error:
+            if not (was_planned and throttle.get_error_code(error) == "ConflictException"):
+                raise
+            logger.info(f"{op} {name} was done before the interruption")
+            response = None
+        self.journal.confirmed(op, name, **details)
+        return response
+
+    def create_program(self, program, previous_program_name=None):
+        program_name = get_program_name(program.wpk, program.start_ms)
+        logger.info(f"{program_name=}")
+        self.journaled(
+            "create_program",
+            program_name,
+            lambda: schedule_program(
                 client=self.client,
                 wpk=program.wpk,
                 program_name=program_name,
-                program_start=program.program_start,
-                chapters=program.chapters,
+                program_start_milliseconds=program.start_ms,
+                chapter_offsets_ms=program.chapter_offsets_ms,
                 previous_program_name=previous_program_name,
+                channel=self.channel,
+            ),
+            wpk=program.wpk,
+            previous=previous_program_name,
+        )
+        return program_name
+
+    def create_programs(self, programs, previous_program_name=None):
+        # returns the name of the last program, the next one can be chained to it
+        self._schedule_snapshot = None
+        if self.use_async:
+            return self.async_engine.run(
+                self.async_engine.create_programs(programs, previous_program_name)
+            )
+        for program in programs:
+            previous_program_name = self.create_program(program, previous_program_name)
+        return previous_program_name
+
+    def commit(self, force, day_windows=None):
+        # day_windows: [start_ms, end_ms) windows committed one after the other, the
+        # relative chain continues from the last program of the previous day
+        if not self.can_commit(force):
+            return
+        if not day_windows:
+            self.create_programs(self.schedule)
+            return
+        previous_program_name = None
+        for (start_ms, end_ms) in day_windows:
+            programs = [
+                program
+                for program in self.schedule
+                if start_ms <= program.start_ms < end_ms
+            ]
+            logger.info(
+                f"committing {len(programs)} programs for {utils.pretty_datetime(utils.datetime_from_epoch_milliseconds(start_ms))}"
+            )
+            previous_program_name = self.create_programs(
+                programs, previous_program_name
             )
-            previous_program_name = program_name
 
-    def is_provisioned(self, program):
-        if program.wpk not in self.available_wpks:
-            video_asset = si.VideoAsset(wpk=program.wpk)
-            if video_asset.is_available:
-                create_vod_item(
+    def commit_pipelined(self, programs, force, lookahead=config.PIPELINE_LOOKAHEAD):
+        # lookups first (availability decides whether to commit at all), then vod source
+        # creation runs ahead of the program chain instead of before it
+        self.ensure_valid()
+        now_ms = utils.get_UTC_now_milliseconds()
+        programs = [program for program in programs if program.start_ms >= now_ms]
+        wpks = self.get_unprovisioned_wpks(programs)
+        lookup_wpks = [wpk for wpk in wpks if wpk not in self._video_assets]
+        self._video_assets.update(
+            self.async_engine.run(self.async_engine.resolve(lookup_wpks))
+        )
+        for wpk in wpks:
+            if not self._video_assets[wpk].is_available:
+                logger.warning(f"{wpk} is not available!")
+                self.add_wpk_to_unavailable((wpk, "is not available!"))
+        self._program_schedule = [
+            program
+            for program in programs
+            if not self.is_reported_unavailable(program.wpk)
+        ]
+        if not self.can_commit(force):
+            return
+        self._schedule_snapshot = None
+        return self.async_engine.run(
+            self.async_engine.run_pipeline(self.schedule, lookahead=lookahead)
+        )
+
+    def reconcile(self, force, window_start, window_end):
+        # only touch the active programs that start in the window (end inclusive, like the playlist filter).
+        # Returns whether the schedule was reconciled
+        if not self.can_commit(force):
+            return False
+        self.ensure_valid()
+        now = utils.get_UTC_now()
+        window_start = max(window_start, now)
+        # programs are selected by their playlist start, relative ones can have drifted
+        # past the window
+        duration_minutes = (
+            int((window_end - now).total_seconds() // 60) + 1 + RECONCILE_DRIFT_MINUTES
+        )
+        active = [
+            scheduled_program
+            for scheduled_program in self.active_schedule(duration_minutes)
+            if is_scheduled_program(scheduled_program)
+        ]
+        (window_start_ms, window_end_ms) = (
+            utils.get_epoch_timestamp_milliseconds(window_start),
+            utils.get_epoch_timestamp_milliseconds(window_end),
+        )
+        scheduled = [
+            scheduled_program
+            for scheduled_program in active
+            if window_start_ms
+            <= get_planned_start_milliseconds(scheduled_program)
+            <= window_end_ms
+        ]
+        planned = [
+            program
+            for program in self.schedule
+            if window_start_ms <= program.start_ms <= window_end_ms
+        ]
+        (head, deletes, creates, tail) = get_reconcile_plan(planned, scheduled)
+        # a program outside the window that has the name of a create would conflict
+        create_names = {
+            get_program_name(program.wpk, program.start_ms) for program in creates
+        }
+        selected_names = {
+            scheduled_program["ProgramName"] for scheduled_program in scheduled
+        }
+        deletes += [
+            scheduled_program
+            for scheduled_program in active
+            if scheduled_program["ProgramName"] in create_names
+            and scheduled_program["ProgramName"] not in selected_names
+        ]
+        delete_names = {
+            scheduled_program["ProgramName"] for scheduled_program in deletes
+        }
+        # the new section follows the program before it and is followed by the program
+        # after it, also when those are outside the window
+        before = [
+            scheduled_program
+            for scheduled_program in active
+            if get_planned_start_milliseconds(scheduled_program) < window_start_ms
+            and scheduled_program["ProgramName"] not in delete_names
+        ]
+        after = tail or [
+            scheduled_program
+            for scheduled_program in active
+            if get_planned_start_milliseconds(scheduled_program) > window_end_ms
+            and scheduled_program["ProgramName"] not in delete_names
+        ]
+        relink = after[0] if (deletes or creates) and after else None
+        logger.info(
+            f"reconcile: keeping {len(head) + len(tail)}, deleting {len(deletes)}, creating {len(creates)}, relinking {int(bool(relink))}"
+        )
+        for scheduled_program in deletes:
+            delete_scheduled_program(
+                self.client, scheduled_program["ProgramName"], self.channel
+            )
+        self._schedule_snapshot = None
+        previous_program_name = (head or before or [{"ProgramName": None}])[-1][
+            "ProgramName"
+        ]
+        previous_program_name = self.create_programs(creates, previous_program_name)
+        if relink:
+            self.relink_program(relink, previous_program_name)
+        return True
+
+    def relink_program(self, scheduled_program, previous_program_name):
+        # recreates a scheduled program after previous_program_name (from its start when
+        # None), under its name so the programs that follow it stay linked to it
+        program_name = scheduled_program["ProgramName"]
+        program_info = get_program_info(self.client, program_name, self.channel)
+        logger.info(f"relinking {program_name} after {previous_program_name}")
+
+        def relink():
+            delete_scheduled_program(self.client, program_name, self.channel)
+            return schedule_program(
+                client=self.client,
+                wpk=program_info["VodSourceName"],
+                program_name=program_name,
+                program_start_milliseconds=get_planned_start_milliseconds(
+                    scheduled_program
+                ),
+                chapter_offsets_ms=[
+                    adbreak["OffsetMillis"] for adbreak in program_info.get("AdBreaks", [])
+                ],
+                previous_program_name=previous_program_name,
+                channel=self.channel,
+            )
+
+        self.journaled(
+            "relink_program",
+            program_name,
+            relink,
+            wpk=program_info["VodSourceName"],
+            previous=previous_program_name,
+        )
+        self._schedule_snapshot = None
+
+    def create_vod_source(self, video_asset):
+        # returns whether the vod source was created (or is there already). Created once
+        # per source location through the inventory, also when channels share it
+        if not video_asset.is_available:
+            logger.warning(f"{video_asset.wpk} is not available!")
+            return False
+        self.inventory.provision_source(
+            self.channel.vod_source_location,
+            video_asset.wpk,
+            lambda: self.journaled(
+                "create_vod_source",
+                video_asset.wpk,
+                lambda: create_vod_item(
                     self.client,
                     wpk=video_asset.wpk,
                     hls_url="out/v1/"
                     + video_asset.get_non_drm_streaming_url_by_protocol("HLS"),
                     dash_url="out/v1/"
                     + video_asset.get_non_drm_streaming_url_by_protocol("DASH"),
-                )
+                    channel=self.channel,
+                ),
+            ),
+        )
+        return True
+
+    def is_reported_unavailable(self, wpk):
+        return any(unavailable[0] == wpk for unavailable in self._unavailable_wpks)
+
+    def is_provisioned(self, program):
+        if program.wpk not in self.available_wpks:
+            if self.is_reported_unavailable(program.wpk):
+                return False
+            if self.create_vod_source(self.get_video_asset(program.wpk)):
                 self.add_wpk_to_available(program.wpk)
             else:
                 self.add_wpk_to_unavailable((program.wpk, "is not available!"))
-                logger.warning(f"{program.wpk} is not available!")
         return program.wpk in self.available_wpks
 
     def delete_vod_time(self, wpk):
-        return delete_vod_item(self.client, wpk)
+        self.ensure_valid()
+        response = delete_vod_item(self.client, wpk, self.channel)
+        self.inventory.remove_source(self.channel.vod_source_location, wpk)
+        return response
 
     def delete_all_provisioned_vod_items(self):
-        for wpk in self.available_wpks:
-            self.delete_vod_time(wpk)
+        # the source location can be shared by channels, sources that are in the
+        # schedule of another channel are kept
+        in_use = get_sources_in_use(
+            self.client,
+            self.channel.vod_source_location,
+            [name for name in self.inventory.channels if name != self.channel.name],
+        )
+        wpks = [wpk for wpk in self.available_wpks if wpk not in in_use]
+        if len(wpks) < len(self.available_wpks):
+            logger.warning(
+                f"keeping {len(self.available_wpks) - len(wpks)} vod sources used by other channels"
+            )
+        return bulk.run_bulk("delete_vod_source", self.delete_vod_time, wpks)
@@ -0,0 +1,83 @@
+from src import log
+import json
+import os
+import sqlite3
+import threading
+import time
+
+logger = log.setup_custom_logger(__name__, loglevel="info")
+logger.debug(f"initiated module: {__name__}")
+
+
+class MetadataCache:
+    # api responses per wpk, an item of None means the wpk was not available
+    def __init__(self, path, ttl, negative_ttl, refresh=False) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.refresh = refresh
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def __repr__(self) -> str:
+        return f"<MetadataCache {self.path} ttl={self.ttl} negative_ttl={self.negative_ttl} refresh={self.refresh}>"
+
+    @property
+    def connection(self):
+        if not self._connection:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS video_asset (wpk TEXT PRIMARY KEY, item TEXT, fetched_at REAL)"
+            )
+        return self._connection
+
+    def is_fresh(self, item, fetched_at, now):
+        ttl = self.ttl if item is not None else self.negative_ttl
+        return now - fetched_at < ttl
+
+    def get(self, wpk):
+        # returns (hit, item)
+        if self.refresh:
+            return (False, None)
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT item, fetched_at FROM video_asset WHERE wpk = ?", (wpk,)
+            ).fetchone()
+        if not row:
+            return (False, None)
+        item = json.loads(row[0]) if row[0] is not None else None
+        if not self.is_fresh(item, row[1], time.time()):
+            return (False, None)
+        return (True, item)
+
+    def get_many(self, wpks):
+        hits = {}
+        for wpk in wpks:
+            (hit, item) = self.get(wpk)
+            if hit:
+                hits[wpk] = item
+        return hits
+
+    def put(self, wpk, item):
+        self.put_many({wpk: item})
+
+    def put_many(self, items):
+        now = time.time()
+        rows = [
+            (wpk, json.dumps(item) if item is not None else None, now)
+            for (wpk, item) in items.items()
+        ]
+        with self._lock:
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO video_asset (wpk, item, fetched_at) VALUES (?, ?, ?)",
+                    rows,
+                )
+
+    def close(self):
+        if self._connection:
+            self._connection.close()
+            self._connection = None
@@ -0,0 +1,192 @@
+from src import log
+from contextlib import contextmanager
+import json
+import os
+import threading
+import time
+
+logger = log.setup_custom_logger(__name__, loglevel="info")
+logger.debug(f"initiated module: {__name__}")
+
+PROMETHEUS_PREFIX = "fastfromvod"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class OperationMetrics:
+    def __init__(self) -> None:
+        self.calls = 0
+        self.throttles = 0
+        self.retries = 0
+        self.errors = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)  # the last one is +Inf
+
+    def __repr__(self) -> str:
+        return f"<OperationMetrics calls={self.calls} throttles={self.throttles} retries={self.retries} errors={self.errors} bytes={self.bytes} seconds={self.seconds:.2f}>"
+
+    def observe(self, seconds):
+        self.seconds += seconds
+        for (index, upper_bound) in enumerate(LATENCY_BUCKETS):
+            if seconds <= upper_bound:
+                self.bucket_counts[index] += 1
+                return
+        self.bucket_counts[-1] += 1
+
+    def as_dict(self):
+        return dict(
+            calls=self.calls,
+            throttles=self.throttles,
+            retries=self.retries,
+            errors=self.errors,
+            bytes=self.bytes,
+            seconds=self.seconds,
+            latency_buckets=dict(
+                zip([str(bound) for bound in LATENCY_BUCKETS] + ["+Inf"], self.bucket_counts)
+            ),
+        )
+
+
+def escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def get_prometheus_labels(labels):
+    return ",".join(
+        f'{name}="{escape_label_value(value)}"' for (name, value) in labels.items()
+    )
+
+
+class Metrics:
+    # wall time per stage and calls, latencies, retries/throttles/errors and bytes per
+    # operation (MediaTailor api calls, video api lookups, playlist files), thread safe.
+    # `labels` (e.g. channel and days) are added to every prometheus sample
+    def __init__(self, labels=None) -> None:
+        self.labels = dict(labels or {})
+        self.stages = {}
+        self.operations = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"<Metrics {self.labels} stages={list(self.stages)} operations={list(self.operations)}>"
+
+    @contextmanager
+    def stage(self, name):
+        # wall time of the block, added up when a stage runs more than once
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.stages[name] = self.stages.get(name, 0.0) + time.monotonic() - started
+
+    def record(
+        self,
+        operation_name,
+        seconds=None,
+        nbytes=0,
+        throttled=False,
+        retry=False,
+        error=False,
+    ):
+        # one call (attempt) of an operation, seconds=None when its latency isn't known
+        with self._lock:
+            if operation_name not in self.operations:
+                self.operations[operation_name] = OperationMetrics()
+            operation = self.operations[operation_name]
+            operation.calls += 1
+            operation.throttles += throttled
+            operation.retries += retry
+            operation.errors += error
+            operation.bytes += nbytes
+            if seconds is not None:
+                operation.observe(seconds)
+
+    def get_count(self, operation_name, counter):
+        # e.g. get_count("delete_program", "throttles"), 0 before the first call
+        with self._lock:
+            operation = self.operations.get(operation_name)
+            return getattr(operation, counter) if operation else 0
+
+    def as_dict(self):
+        with self._lock:
+            return dict(
+                labels=self.labels,
+                stages=dict(self.stages),
+                operations={
+                    operation_name: operation.as_dict()
+                    for (operation_name, operation) in sorted(self.operations.items())
+                },
+            )
+
+    def get_prometheus_lines(self):
+        summary = self.as_dict()
+        labels = get_prometheus_labels(self.labels)
+        separator = "," if labels else ""
+        lines = [
+            f"# HELP {PROMETHEUS_PREFIX}_stage_seconds Wall time per stage of the run",
+            f"# TYPE {PROMETHEUS_PREFIX}_stage_seconds gauge",
+        ]
+        for (stage, seconds) in summary["stages"].items():
+            lines.append(
+                f'{PROMETHEUS_PREFIX}_stage_seconds{{{labels}{separator}stage="{stage}"}} {seconds}'
+            )
+        for (counter, description) in (
+            ("calls", "Calls per operation, retries included"),
+            ("throttles", "Throttled calls per operation"),
+            ("retries", "Retried calls per operation"),
+            ("errors", "Failed calls per operation, after retries"),
+            ("bytes", "Bytes received (or read) per operation"),
+        ):
+            lines.append(f"# HELP {PROMETHEUS_PREFIX}_operation_{counter}_total {description}")
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_operation_{counter}_total counter")
+            for (operation_name, operation) in summary["operations"].items():
+                lines.append(
+                    f'{PROMETHEUS_PREFIX}_operation_{counter}_total{{{labels}{separator}operation="{operation_name}"}} {operation[counter]}'
+                )
+        histogram = f"{PROMETHEUS_PREFIX}_operation_latency_seconds"
+        lines.append(f"# HELP {histogram} Latency per call of an operation")
+        lines.append(f"# TYPE {histogram} histogram")
+        for (operation_name, operation) in summary["operations"].items():
+            operation_labels = f'{labels}{separator}operation="{operation_name}"'
+            cumulative = 0
+            for (bound, count) in operation["latency_buckets"].items():
+                cumulative += count
+                lines.append(
+                    f'{histogram}_bucket{{{operation_labels},le="{bound}"}} {cumulative}'
+                )
+            lines.append(f"{histogram}_sum{{{operation_labels}}} {operation['seconds']}")
+            lines.append(f"{histogram}_count{{{operation_labels}}} {cumulative}")
+        return lines
+
+    def write_json(self, path):
+        write_file(path, json.dumps(self.as_dict(), indent=2) + "\n")
+
+    def write_prometheus(self, path):
+        write_file(path, "\n".join(self.get_prometheus_lines()) + "\n")
+
+    def log_summary(self):
+        for (stage, seconds) in self.stages.items():
+            logger.info(f"stage {stage}: {seconds:.2f}s")
+        for (operation_name, operation) in sorted(self.operations.items()):
+            logger.info(f"{operation_name}: {operation}")
+
+
+def write_file(path, content):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+_metrics = Metrics()
+
+
+def get_metrics():
+    return _metrics
+
+
+def set_metrics(metrics):
+    global _metrics
+    _metrics = metrics
@@ -0,0 +1,121 @@
+from src import log
+from array import array
+import hashlib
+import marshal
+import os
+import tempfile
+
+logger = log.setup_custom_logger(__name__, loglevel="info")
+logger.debug(f"initiated module: {__name__}")
+
+FORMAT_VERSION = 1
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def get_file_hash(fname):
+    digest = hashlib.sha256()
+    with open(fname, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def encode_records(records, last_wpk):
+    # the records of a file as columns, like the TimelineStore, in one marshal blob
+    wpks = []
+    program_start_ms = array("q")
+    event_count = array("q")
+    event_kind = array("b")
+    event_start_ms = array("q")
+    event_media_ms = array("q")
+    event_title = []
+    for (wpk, start_ms, event_records) in records:
+        wpks.append(wpk)
+        program_start_ms.append(start_ms)
+        event_count.append(len(event_records))
+        for (kind, event_start, media_ms, title) in event_records:
+            event_kind.append(kind)
+            event_start_ms.append(event_start)
+            event_media_ms.append(media_ms)
+            event_title.append(title)
+    return marshal.dumps(
+        (
+            FORMAT_VERSION,
+            wpks,
+            program_start_ms.tobytes(),
+            event_count.tobytes(),
+            event_kind.tobytes(),
+            event_start_ms.tobytes(),
+            event_media_ms.tobytes(),
+            event_title,
+            last_wpk,
+        )
+    )
+
+
+def decode_records(blob):
+    # returns (records, last_wpk) like read_playlist_records without a window
+    (
+        version,
+        wpks,
+        program_start_bytes,
+        event_count_bytes,
+        event_kind_bytes,
+        event_start_bytes,
+        event_media_bytes,
+        event_title,
+        last_wpk,
+    ) = marshal.loads(blob)
+    assert version == FORMAT_VERSION, f"unknown playlist cache format {version}"
+    (program_start_ms, event_count, event_kind, event_start_ms, event_media_ms) = (
+        array(typecode, data)
+        for (typecode, data) in (
+            ("q", program_start_bytes),
+            ("q", event_count_bytes),
+            ("b", event_kind_bytes),
+            ("q", event_start_bytes),
+            ("q", event_media_bytes),
+        )
+    )
+    events = list(zip(event_kind, event_start_ms, event_media_ms, event_title))
+    records = []
+    first = 0
+    for (wpk, start_ms, count) in zip(wpks, program_start_ms, event_count):
+        records.append((wpk, start_ms, events[first : first + count]))
+        first += count
+    return (records, last_wpk)
+
+
+class PlaylistCache:
+    # parsed records per playlist file, keyed by the hash of the file content so a
+    # changed file is parsed again and a renamed/copied one isn't
+    def __init__(self, directory, refresh=False) -> None:
+        self.directory = directory
+        self.refresh = refresh
+
+    def __repr__(self) -> str:
+        return f"<PlaylistCache {self.directory} refresh={self.refresh}>"
+
+    def get_path(self, file_hash):
+        return os.path.join(self.directory, f"{file_hash}.v{FORMAT_VERSION}.bin")
+
+    def get(self, fname):
+        # returns (file hash, (records, last_wpk) or None)
+        file_hash = get_file_hash(fname)
+        if self.refresh:
+            return (file_hash, None)
+        try:
+            with open(self.get_path(file_hash), "rb") as f:
+                return (file_hash, decode_records(f.read()))
+        except FileNotFoundError:
+            return (file_hash, None)
+        except (AssertionError, EOFError, ValueError, TypeError) as error:
+            logger.warning(f"{fname}: ignoring unreadable cache entry ({error})")
+            return (file_hash, None)
+
+    def put(self, file_hash, records, last_wpk):
+        os.makedirs(self.directory, exist_ok=True)
+        (fd, tmp_path) = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(encode_records(records, last_wpk))
+        os.replace(tmp_path, self.get_path(file_hash))
@@ -1,107 +1,340 @@
 from src import log
+from src import metrics
+from src import timeline
 from src import utils
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import os
+import sys
+import time
 import xml.etree.ElementTree as ET
 
 logger = log.setup_custom_logger(__name__, loglevel="info")
-logger.info(f"initiated module: {__name__}")
+logger.debug(f"initiated module: {__name__}")
 
 
 SLATE_AD_LENGTH = 190
+CHAPTER = "Chapter"
+ADBREAK = "Adbreak"
 ONE_DAY = utils.seconds_to_timedelta(24 * 60 * 60)
+ONE_DAY_MS = 24 * 60 * 60 * 1000
+
+
+def iter_playlist_elements(fname):
+    # stream the top level elements, each one is cleared once the caller is done with it
+    depth = 0
+    root = None
+    for (event, element) in ET.iterparse(fname, events=("start", "end")):
+        if event == "start":
+            if depth == 0:
+                root = element
+            depth += 1
+            continue
+        depth -= 1
+        if depth != 1:
+            continue
+        yield element
+        root.clear()
+
+
+def read_playlist_records(fname, window_start_ms, window_end_ms):
+    # compact, picklable program records: (wpk, program_start_ms, [(kind, start_ms, media_ms, title)]).
+    # The first record is always the run of items the file starts with, it might continue
+    # the last program of the previous file. Other programs are only kept when they start
+    # in the window. `kept_last` tells whether the last program was kept (None: same as the first)
+    records = []
+    last_wpk = None
+    skipping = False
+    kept_last = None
+    for playlist_event in iter_playlist_elements(fname):
+        if playlist_event.tag == "scheduledItem":
+            wpk = playlist_event.attrib["WPK"]
+            if wpk != last_wpk:
+                last_wpk = wpk
+                program_start_ms = utils.epoch_milliseconds_from_isostring(
+                    playlist_event.attrib["StartTime"]
+                )
+                if not records:
+                    records.append((wpk, program_start_ms, []))
+                    (skipping, kept_last) = (False, None)
+                elif program_start_ms > window_end_ms:
+                    # playlists are chronological, nothing after this can be in the window
+                    logger.info(f"{fname}: skipping the rest, past the target window")
+                    kept_last = False
+                    break
+                elif program_start_ms >= window_start_ms:
+                    records.append((wpk, program_start_ms, []))
+                    (skipping, kept_last) = (False, True)
+                else:
+                    (skipping, kept_last) = (True, False)
+            if skipping:
+                continue
+            start_ms = utils.epoch_milliseconds_from_isostring(
+                playlist_event.attrib["StartTime"]
+            )
+            for chaptermarker in playlist_event:
+                try:
+                    records[-1][2].append(
+                        (
+                            timeline.KIND_CHAPTER,
+                            start_ms,
+                            utils.milliseconds_from_timestamp(
+                                chaptermarker.attrib["MediaStartTime"]
+                            ),
+                            playlist_event.attrib["Title"],
+                        )
+                    )
+                except:
+                    logger.info(chaptermarker.attrib)
+                    sys.exit()
+        elif records and not skipping:
+            duration = int(
+                utils.seconds_from_iso_timestring(playlist_event.attrib["Duration"])
+            )
+            assert (
+                duration == SLATE_AD_LENGTH
+            ), f"Adbreaks have a fixed duration of {SLATE_AD_LENGTH}, got: {duration}"
+            records[-1][2].append(
+                (
+                    timeline.KIND_ADBREAK,
+                    utils.epoch_milliseconds_from_isostring(
+                        playlist_event.attrib["StartTime"]
+                    ),
+                    duration * 1000,
+                    None,
+                )
+            )
+    return (records, last_wpk, kept_last)
+
+
+def read_all_playlist_records(fname):
+    # (records, last_wpk) of every program in the file, what the playlist cache stores
+    (records, last_wpk, _) = read_playlist_records(fname, -sys.maxsize, sys.maxsize)
+    return (records, last_wpk)
+
+
+def filter_playlist_records(records, last_wpk, window_start_ms, window_end_ms):
+    # what read_playlist_records returns for the window, from all the records of a file
+    if not records:
+        return (records, last_wpk, None)
+    kept = records[:1]
+    kept_last = None
+    for record in records[1:]:
+        (wpk, program_start_ms, _) = record
+        if program_start_ms > window_end_ms:
+            return (kept, wpk, False)
+        if program_start_ms >= window_start_ms:
+            kept.append(record)
+            kept_last = True
+        else:
+            kept_last = False
+    return (kept, last_wpk, kept_last)
+
+
+def record_playlist_read(fname, seconds=None):
+    metrics.get_metrics().record(
+        "read_playlist", seconds=seconds, nbytes=os.path.getsize(fname)
+    )
+
+
+def get_timeline_event(timeline_store, event_index):
+    start_ms = timeline_store.event_start_ms[event_index]
+    media_ms = timeline_store.event_media_ms[event_index]
+    if timeline_store.event_kind[event_index] == timeline.KIND_CHAPTER:
+        return Chapter(start_ms, timeline_store.event_title[event_index], media_ms)
+    return Adbreak(start_ms, media_ms // 1000)
 
 
 class PlaylistParser:
-    def __init__(self, target_date) -> None:
+    def __init__(self, target_date, last_date=None, playlist_cache=None) -> None:
+        # window: target_date up to and including last_date (defaults to target_date)
         self.target_date = utils.get_target_UTC_day(target_date)
-        self._programs = []
+        self.last_date = utils.get_target_UTC_day(last_date or target_date)
+        self.window_start = self.target_date
+        self.window_end = self.last_date + ONE_DAY
+        self.window_start_ms = utils.get_epoch_timestamp_milliseconds(self.window_start)
+        self.window_end_ms = utils.get_epoch_timestamp_milliseconds(self.window_end)
+        self.playlist_cache = playlist_cache
+        self._store = timeline.TimelineStore()
         self._root = None
+        self._last_wpk = None
+        self._skipping = False
         self._date_filter_start = None
         self._date_filter_end = None
 
     def __repr__(self) -> str:
         return f"<Playlist {self.root} >"
 
+    def is_in_window(self, program_start_ms):
+        return self.window_start_ms <= program_start_ms <= self.window_end_ms
+
     def target_date_filter(self, program):
         return (  # program starts at/after target AND start before target + 1 day
-            self.target_date <= program.program_start <= self.target_date + ONE_DAY
+            self.is_in_window(program.start_ms)
         )
 
+    def get_day_windows(self):
+        # [start_ms, end_ms) per day of the window, the last one includes the end of the window
+        day_windows = [
+            (day_start_ms, day_start_ms + ONE_DAY_MS)
+            for day_start_ms in range(self.window_start_ms, self.window_end_ms, ONE_DAY_MS)
+        ]
+        (last_start_ms, last_end_ms) = day_windows[-1]
+        day_windows[-1] = (last_start_ms, last_end_ms + 1)
+        return day_windows
+
+    @property
+    def timeline_store(self):
+        return self._store
+
     def add_xml(self, fname: str):
-        tree = ET.parse(fname)
-        root = tree.getroot()
-        for playlist_event in root:
-            if playlist_event.tag == "scheduledItem":
-                wpk = playlist_event.attrib["WPK"]
-                current_program = self.get_current_playlist_program(wpk)
-                for chaptermarker in playlist_event:
-                    try:
-                        current_program.add_timeline_event(
-                            Chapter(
-                                starttime=playlist_event.attrib["StartTime"],
-                                title=playlist_event.attrib["Title"],
-                                media_starttime=chaptermarker.attrib["MediaStartTime"],
-                            )
-                        )
-                    except:
-                        logger.info(chaptermarker.attrib)
-                        sys.exit()
+        if self.playlist_cache:
+            self.add_xmls([fname])
+            return
+        started = time.monotonic()
+        self.add_records(
+            *read_playlist_records(fname, self.window_start_ms, self.window_end_ms)
+        )
+        record_playlist_read(fname, seconds=time.monotonic() - started)
+
+    def add_xmls(self, fnames, max_workers=None):
+        # parse the files in a process pool, merged in the given order like add_xml per file
+        if self.playlist_cache:
+            self.add_cached_xmls(fnames, max_workers=max_workers)
+            return
+        if len(fnames) < 2 or max_workers == 1:
+            for fname in fnames:
+                self.add_xml(fname)
+            return
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for (fname, file_records) in zip(
+                fnames,
+                executor.map(
+                    read_playlist_records,
+                    fnames,
+                    repeat(self.window_start_ms),
+                    repeat(self.window_end_ms),
+                ),
+            ):
+                self.add_records(*file_records)
+                record_playlist_read(fname)
+
+    def add_cached_xmls(self, fnames, max_workers=None):
+        # only the files that aren't in the playlist cache are parsed (all of their programs,
+        # the cache doesn't depend on the window), the window is applied when merging
+        cached = {fname: self.playlist_cache.get(fname) for fname in fnames}
+        misses = [fname for (fname, (_, records)) in cached.items() if records is None]
+        logger.info(f"{len(cached) - len(misses)} playlists from cache, parsing {len(misses)}")
+        if len(misses) < 2 or max_workers == 1:
+            parsed = []
+            for fname in misses:
+                started = time.monotonic()
+                parsed.append(read_all_playlist_records(fname))
+                record_playlist_read(fname, seconds=time.monotonic() - started)
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                parsed = list(executor.map(read_all_playlist_records, misses))
+            for fname in misses:
+                record_playlist_read(fname)
+        for (fname, file_records) in zip(misses, parsed):
+            (file_hash, _) = cached[fname]
+            self.playlist_cache.put(file_hash, *file_records)
+            cached[fname] = (file_hash, file_records)
+        for fname in fnames:
+            (_, file_records) = cached[fname]
+            self.add_all_records(*file_records)
+
+    def add_all_records(self, records, last_wpk):
+        # the records of every program in a file (see read_all_playlist_records)
+        self.add_records(
+            *filter_playlist_records(
+                records, last_wpk, self.window_start_ms, self.window_end_ms
+            )
+        )
+
+    def add_records(self, records, last_wpk, kept_last):
+        if not records:
+            return
+        for (index, (wpk, program_start_ms, event_records)) in enumerate(records):
+            if index == 0 and wpk == self._last_wpk:
+                # continues the last program of the previous file
+                program_index = None if self._skipping else len(self._store) - 1
+            elif index == 0 and not self.is_in_window(program_start_ms):
+                program_index = None
             else:
-                current_program.add_timeline_event(
-                    Adbreak(
-                        starttime=playlist_event.attrib["StartTime"],
-                        duration=int(
-                            utils.seconds_from_iso_timestring(
-                                playlist_event.attrib["Duration"]
-                            )
-                        ),
-                    )
-                )
+                program_index = self._store.add_program(wpk, program_start_ms)
+            if index == 0:
+                kept_first = program_index is not None
+            if program_index is not None:
+                for event_record in event_records:
+                    self._store.add_event(program_index, *event_record)
+        self._last_wpk = last_wpk
+        self._skipping = not (kept_first if kept_last is None else kept_last)
+
+    def get_programs(self, program_indices):
+        return [Program(self._store, program_index) for program_index in program_indices]
+
+    def get_parsed_programs(self, window_start_ms=None, window_end_ms=None) -> list:
+        # programs starting in the window, the target day by default (end inclusive)
+        if window_start_ms is None:
+            window_start_ms = self.window_start_ms
+        if window_end_ms is None:
+            window_end_ms = self.window_end_ms
+        return self.get_programs(
+            self._store.programs_in_window(window_start_ms, window_end_ms)
+        )
 
-    def get_current_playlist_program(self, wpk):
-        try:
-            if self._programs[-1].wpk != wpk:
-                self._programs.append(Program(wpk=wpk))
-        except IndexError:
-            # empty list, add the first one to the list
-            self._programs.append(Program(wpk=wpk))
-            pass
-        return self._programs[-1]
+    def get_programs_overlapping(self, start_ms, end_ms) -> list:
+        return self.get_programs(self._store.programs_overlapping(start_ms, end_ms))
 
-    def get_parsed_programs(self) -> list:
-        self._programs.sort()
-        return filter(self.target_date_filter, self._programs)
+    def get_program_on_air(self, at_ms):
+        program_index = self._store.program_on_air(at_ms)
+        if program_index is None:
+            return None
+        return Program(self._store, program_index)
 
 
 class Program:
-    def __init__(self, wpk) -> None:
-        self._wpk = wpk
-        self._timeline = []
+    # view on one program in the TimelineStore
+    __slots__ = ("_store", "_index")
+
+    def __init__(self, store, index) -> None:
+        self._store = store
+        self._index = index
 
     def __repr__(self) -> str:
         return f"<Program ({self.wpk}) starts at {self.program_start} >"
 
     def __lt__(self, obj):
         # magic method to allow sorting of Program objects
-        return (self.program_start) < (obj.program_start)
+        return self.start_ms < obj.start_ms
 
     @property
     def wpk(self):
-        return self._wpk
+        return self._store.wpks[self._index]
 
     @property
-    def program_start(self):
-        return self._timeline[0].starttime
+    def start_ms(self):
+        return self._store.program_start_ms[self._index]
 
-    def add_timeline_event(self, timeline_event):
-        self._timeline.append(timeline_event)
+    @property
+    def program_start(self):
+        return utils.datetime_from_epoch_milliseconds(self.start_ms)
 
     @property
     def timeline(self):
-        return self._timeline
+        return [
+            get_timeline_event(self._store, event_index)
+            for event_index in self._store.event_range(self._index)
+        ]
+
+    @property
+    def chapter_offsets_ms(self):
+        return self._store.chapter_offsets(self._index)
 
     @classmethod
     def is_chapter(cls, timeline_event):
-        return timeline_event.type == "Chapter"
+        return timeline_event.type == CHAPTER
 
     @classmethod
     def is_adbreak(cls, timeline_event):
@@ -117,11 +350,14 @@ class Program:
 
 
 class Chapter:
-    def __init__(self, starttime, title, media_starttime) -> None:
-        self._starttime = starttime
-        self.type = "Chapter"
+    # times are parsed once, in milliseconds since the epoch / since the start of the media
+    __slots__ = ("start_ms", "title", "media_start_ms")
+    type = CHAPTER
+
+    def __init__(self, start_ms, title, media_start_ms) -> None:
+        self.start_ms = start_ms
         self.title = title
-        self._media_starttime = media_starttime
+        self.media_start_ms = media_start_ms
 
     def __repr__(self) -> str:
         return (
@@ -130,17 +366,19 @@ class Chapter:
 
     @property
     def starttime(self):
-        return utils.datetime_from_isostring(self._starttime)
+        return utils.datetime_from_epoch_milliseconds(self.start_ms)
 
     @property
     def media_starttime(self):
-        return utils.get_offset_from_timestamp(self._media_starttime)
+        return self.media_start_ms / 1000
 
 
 class Adbreak:
-    def __init__(self, starttime, duration) -> None:
-        self._starttime = starttime
-        self.type = "Adbreak"
+    __slots__ = ("start_ms", "_duration")
+    type = ADBREAK
+
+    def __init__(self, start_ms, duration) -> None:
+        self.start_ms = start_ms
         assert (
             duration == SLATE_AD_LENGTH
         ), f"Adbreaks have a fixed duration of {SLATE_AD_LENGTH}, got: {duration}"
@@ -161,4 +399,4 @@ class Adbreak:
 
     @property
     def starttime(self):
-        return utils.datetime_from_isostring(self._starttime)
+        return utils.datetime_from_epoch_milliseconds(self.start_ms)
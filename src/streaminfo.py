@@ -1,10 +1,35 @@
 from collections import namedtuple
+from src import config
 from src import log
+from src import metrics
 import json
-import requests
+import threading
+import time
 
 logger = log.setup_custom_logger(__name__, loglevel="info")
-logger.info(f"initiated module: {__name__}")
+logger.debug(f"initiated module: {__name__}")
+
+VIDEO_API_URL = "https://api.prd.video.talpa.network/graphql"
+BATCH_SIZE = 50
+
+_metadata_cache = None
+_session = None
+_session_lock = threading.Lock()
+
+
+def set_metadata_cache(metadata_cache):
+    global _metadata_cache
+    _metadata_cache = metadata_cache
+
+
+def get_metadata_cache():
+    return _metadata_cache
+
+
+def set_video_api_url(url):
+    # e.g. a local stub of the api
+    global VIDEO_API_URL
+    VIDEO_API_URL = url
 
 
 def get_query():
@@ -36,19 +61,133 @@ def get_query():
             }"""
 
 
-def get_video_info(wpk):
-    url = "https://api.prd.video.talpa.network/graphql"
+def create_session(
+    pool_size=config.VIDEO_API_POOL_SIZE, retries=config.VIDEO_API_RETRIES
+):
+    # keep-alive connections shared by all lookups, retries on connection errors and 429/5xx.
+    # requests is imported here, on the first lookup, to keep startup fast
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(
+        total=retries,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET"],
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1, pool_maxsize=pool_size, max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(
+        {
+            "content-type": "application/json",
+            "x-client-id": "kijk",
+        }
+    )
+    return session
+
+
+def configure_session(
+    pool_size=config.VIDEO_API_POOL_SIZE, retries=config.VIDEO_API_RETRIES
+):
+    global _session
+    with _session_lock:
+        if _session:
+            _session.close()
+        _session = create_session(pool_size=pool_size, retries=retries)
+    return _session
+
+
+def get_session():
+    global _session
+    with _session_lock:
+        if not _session:
+            _session = create_session()
+        return _session
+
+
+def get_videos_info(wpks, limit=None, skip=None):
     params = {}
     params["query"] = get_query()
-    params["variables"] = json.dumps({"videoId": [wpk]})
+    variables = {"videoId": list(wpks)}
+    if limit:
+        variables["limit"] = limit
+    if skip:
+        variables["skip"] = skip
+    params["variables"] = json.dumps(variables)
+
+    started = time.monotonic()
+    try:
+        r = get_session().get(
+            url=VIDEO_API_URL, params=params, timeout=config.VIDEO_API_TIMEOUT
+        )
+        r.raise_for_status()
+    except Exception:
+        metrics.get_metrics().record(
+            "GetVideoDetails", seconds=time.monotonic() - started, error=True
+        )
+        raise
+    metrics.get_metrics().record(
+        "GetVideoDetails", seconds=time.monotonic() - started, nbytes=len(r.content)
+    )
+    api_response = r.json()
+    logger.debug(f"response = {api_response}")
+    return api_response
+
+
+def get_video_info(wpk):
+    return get_videos_info([wpk])
+
 
-    headers = {
-        "content-type": "application/json",
-        "x-client-id": "kijk",
-    }
-    r = requests.get(url=url, params=params, headers=headers)
-    logger.debug(f"response = {r.json()}")
-    return r.json()
+def chunked(items, size):
+    for index in range(0, len(items), size):
+        yield items[index : index + size]
+
+
+def iter_video_items(wpks, batch_size=BATCH_SIZE):
+    # one request per chunk of wpks, paginated in case a chunk has more items than the
+    # limit; done once the last page was short or every wpk of the chunk was in it
+    for chunk in chunked(wpks, batch_size):
+        unseen = set(chunk)
+        skip = 0
+        while True:
+            api_response = get_videos_info(chunk, limit=batch_size, skip=skip)
+            items = api_response["data"]["programs"]["items"]
+            logger.debug(f"{len(chunk)} wpks, {skip=} -> {len(items)} items")
+            yield from items
+            unseen.difference_update(item["guid"] for item in items)
+            if len(items) < batch_size or not unseen:
+                break
+            skip += batch_size
+
+
+def resolve_video_assets(wpks, batch_size=BATCH_SIZE):
+    video_assets = {wpk: VideoAsset(wpk=wpk) for wpk in wpks}
+    metadata_cache = get_metadata_cache()
+    if metadata_cache:
+        for (wpk, item) in metadata_cache.get_many(video_assets).items():
+            video_assets[wpk].set_api_response(item)
+    unresolved = [wpk for wpk in video_assets if not video_assets[wpk].is_resolved]
+    for item in iter_video_items(unresolved, batch_size=batch_size):
+        video_asset = video_assets.get(item["guid"])
+        if video_asset:
+            video_asset.set_api_response(item)
+    for video_asset in video_assets.values():
+        if not video_asset.is_resolved:
+            video_asset.set_api_response(None)
+    if metadata_cache and unresolved:
+        metadata_cache.put_many(
+            {wpk: video_assets[wpk].api_response for wpk in unresolved}
+        )
+    logger.info(f"{len(video_assets) - len(unresolved)} wpks served from cache")
+    logger.info(
+        f"resolved {len(video_assets)} wpks in chunks of {batch_size}, {sum(va.is_available for va in video_assets.values())} available"
+    )
+    return video_assets
 
 
 Stream_Matcher = namedtuple(
@@ -148,22 +287,35 @@ class VideoAsset:
     def __repr__(self) -> str:
         return f"<VideoAsset {self.wpk}, duration {self.duration}, {self.cuepoints}, {self.title}  >"
 
+    @property
+    def is_resolved(self):
+        return self._is_available is not None
+
+    def set_api_response(self, item):
+        self._api_response = item
+        self._is_available = item is not None
+
     @property
     def is_available(self):
-        if not self._is_available:
+        if not self.is_resolved:
             self.api_response
         return self._is_available
 
     @property
     def api_response(self):
-        if not self._api_response:
+        if not self.is_resolved and get_metadata_cache():
+            (hit, item) = get_metadata_cache().get(self.wpk)
+            if hit:
+                self.set_api_response(item)
+        if not self.is_resolved:
             self._is_available = False
             api_response = get_video_info(self.wpk)
             logger.debug(f"{self.wpk} {api_response}")
             for item in api_response["data"]["programs"]["items"]:
                 if item["guid"] == self.wpk:
-                    self._api_response = item
-                    self._is_available = True
+                    self.set_api_response(item)
+            if get_metadata_cache():
+                get_metadata_cache().put(self.wpk, self._api_response)
         return self._api_response
 
     @property
@@ -0,0 +1,57 @@
+from src import playlist_parser as pp
+from src import utils
+import datetime
+import os
+import random
+
+MIN_CHAPTERS = 1
+MAX_CHAPTERS = 4
+MIN_CHAPTER_SECONDS = 5 * 60
+MAX_CHAPTER_SECONDS = 15 * 60
+ADBREAK_DURATION = f"PT{pp.SLATE_AD_LENGTH // 60}M{pp.SLATE_AD_LENGTH % 60}S"
+
+
+def get_media_timestamp(seconds):
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}.000"
+
+
+def get_program_lines(rnd, wpk, start):
+    # one program: a scheduledItem per chapter, each followed by a slate adbreak.
+    # Returns (xml lines, end of the program)
+    lines = []
+    media_seconds = 0
+    for chapter in range(rnd.randint(MIN_CHAPTERS, MAX_CHAPTERS)):
+        lines.append(
+            f'  <scheduledItem WPK="{wpk}" StartTime="{start.isoformat()}" Title="Program {wpk} part {chapter + 1}">\n'
+            f'    <chapterMarker MediaStartTime="{get_media_timestamp(media_seconds)}"/>\n'
+            f"  </scheduledItem>"
+        )
+        chapter_seconds = rnd.randint(MIN_CHAPTER_SECONDS, MAX_CHAPTER_SECONDS)
+        start += utils.seconds_to_timedelta(chapter_seconds)
+        media_seconds += chapter_seconds
+        lines.append(
+            f'  <adBreak StartTime="{start.isoformat()}" Duration="{ADBREAK_DURATION}"/>'
+        )
+        start += utils.seconds_to_timedelta(pp.SLATE_AD_LENGTH)
+    return (lines, start)
+
+
+def write_playlists(directory, first_date, days, seed=0):
+    # one SBS6 like playlist per day, programs go in the file of the day they start in
+    # and follow each other without gaps. Returns the file names in date order
+    rnd = random.Random(seed)
+    first_day = utils.get_target_UTC_day(first_date)
+    start = first_day
+    fnames = []
+    for day in range(days):
+        day_start = first_day + datetime.timedelta(days=day)
+        day_end = day_start + datetime.timedelta(days=1)
+        fname = os.path.join(directory, f"synthetic_{day_start.date().isoformat()}.xml")
+        with open(fname, "w") as f:
+            f.write('<?xml version="1.0" encoding="utf-8"?>\n<playlist>\n')
+            while start < day_end:
+                (lines, start) = get_program_lines(rnd, str(rnd.randint(10000, 99999)), start)
+                f.write("\n".join(lines) + "\n")
+            f.write("</playlist>\n")
+        fnames.append(fname)
+    return fnames
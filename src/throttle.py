@@ -0,0 +1,228 @@
+from src import log
+from src import metrics
+import random
+import threading
+import time
+
+logger = log.setup_custom_logger(__name__, loglevel="info")
+logger.debug(f"initiated module: {__name__}")
+
+THROTTLING_ERROR_CODES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "Throttling",
+    "RequestLimitExceeded",
+}
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_CAP_SECONDS = 20
+
+
+def get_error_code(error):
+    # botocore ClientError carries the error code in its response dict
+    response = getattr(error, "response", None) or {}
+    return response.get("Error", {}).get("Code")
+
+
+def is_throttling_error(error):
+    return get_error_code(error) in THROTTLING_ERROR_CODES
+
+
+def is_connection_error(error):
+    # connection errors and timeouts have no error code; botocore's (EndpointConnectionError,
+    # ConnectionClosedError, ReadTimeoutError, ...) are matched by name so botocore isn't
+    # imported here
+    return any(
+        error_class.__name__ in CONNECTION_ERROR_CLASSES
+        for error_class in type(error).__mro__
+    )
+
+
+def get_backoff_seconds(attempt, base=BACKOFF_BASE_SECONDS, cap=BACKOFF_CAP_SECONDS):
+    # "full jitter": random wait between 0 and the exponential backoff
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+class RateLimiter:
+    # thread safe token bucket, `rate` tokens per second
+    def __init__(self, rate, burst=None) -> None:
+        self.rate = rate
+        self.burst = burst or max(1, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"<RateLimiter {self.rate}/s burst={self.burst}>"
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+ADDITIVE_INCREASE = 1
+MULTIPLICATIVE_DECREASE = 0.5
+RETRYABLE_ERROR_CODES = {
+    "InternalServerErrorException",
+    "ServiceUnavailableException",
+}
+CONNECTION_ERROR_CLASSES = {"HTTPClientError", "ConnectionError", "TimeoutError"}
+
+
+class AdaptiveRateLimiter(RateLimiter):
+    # AIMD: the rate grows by about ADDITIVE_INCREASE per second of successful calls
+    # and is halved on every throttle, within [min_rate, max_rate]
+    def __init__(self, max_rate, min_rate) -> None:
+        super().__init__(max_rate)
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+
+    def __repr__(self) -> str:
+        return f"<AdaptiveRateLimiter {self.rate:.2f}/s [{self.min_rate}, {self.max_rate}]>"
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + ADDITIVE_INCREASE / self.rate)
+
+    def on_throttle(self):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate * MULTIPLICATIVE_DECREASE)
+            self._tokens = min(self._tokens, 0)
+
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(operation_class, max_rate, min_rate):
+    # one limiter per operation class and rates for the whole process: the service limits
+    # are per account, so all clients with the same limits share (and adapt) one bucket
+    key = (operation_class, max_rate, min_rate)
+    with _rate_limiters_lock:
+        if key not in _rate_limiters:
+            _rate_limiters[key] = AdaptiveRateLimiter(
+                max_rate=max_rate, min_rate=min_rate
+            )
+        return _rate_limiters[key]
+
+
+def get_operation_class(operation_name):
+    if operation_name.startswith("delete_"):
+        return "delete"
+    if operation_name.startswith(("create_", "put_", "update_", "start_", "stop_")):
+        return "write"
+    return "read"
+
+
+def get_response_bytes(response):
+    # size of a boto3 response body, 0 when unknown
+    headers = response.get("ResponseMetadata", {}).get("HTTPHeaders", {})
+    return int(headers.get("content-length", 0))
+
+
+class ThrottledClient:
+    # wraps a boto3 client: every operation waits for its class' rate limiter and is
+    # retried with jittered backoff on throttling, transient server errors and connection
+    # errors (botocore doesn't retry, see get_boto_client)
+    def __init__(self, client, rate_limits, min_rate, max_retries) -> None:
+        self._client = client
+        self.rate_limits = rate_limits
+        self.min_rate = min_rate
+        self.max_retries = max_retries
+
+    def __repr__(self) -> str:
+        return f"<ThrottledClient {self._client}>"
+
+    def call(self, operation_name, **kwargs):
+        operation_class = get_operation_class(operation_name)
+        rate_limiter = get_rate_limiter(
+            operation_class, self.rate_limits[operation_class], self.min_rate
+        )
+        func = getattr(self._client, operation_name)
+        attempt = 0
+        maybe_done = False  # an earlier attempt might have reached the service
+        while True:
+            rate_limiter.acquire()
+            started = time.monotonic()
+            error = None
+            try:
+                response = func(**kwargs)
+            except Exception as call_error:
+                error = call_error
+            if (
+                maybe_done
+                and operation_class == "write"
+                and get_error_code(error) == "ConflictException"
+            ):
+                # the create went through before the connection was lost
+                (error, response) = (None, {})
+            throttled = error is not None and is_throttling_error(error)
+            connection_error = error is not None and is_connection_error(error)
+            retry = (
+                error is not None
+                and (
+                    throttled
+                    or connection_error
+                    or get_error_code(error) in RETRYABLE_ERROR_CODES
+                )
+                and attempt < self.max_retries
+            )
+            maybe_done = maybe_done or connection_error
+            metrics.get_metrics().record(
+                operation_name,
+                seconds=time.monotonic() - started,
+                nbytes=get_response_bytes(response) if error is None else 0,
+                throttled=throttled,
+                retry=retry,
+                error=error is not None and not retry,
+            )
+            if error is None:
+                rate_limiter.on_success()
+                return response
+            if throttled:
+                rate_limiter.on_throttle()
+            if not retry:
+                raise error
+            backoff = get_backoff_seconds(attempt)
+            logger.debug(
+                f"{operation_name}: {get_error_code(error)}, retry in {backoff:.2f}s ({rate_limiter})"
+            )
+            time.sleep(backoff)
+            attempt += 1
+
+    def get_paginator(self, operation_name):
+        return ThrottledPaginator(self, operation_name)
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        if not callable(attribute):
+            return attribute
+        return lambda **kwargs: self.call(name, **kwargs)
+
+
+class ThrottledPaginator:
+    # same interface as a boto3 paginator, but every page is a throttled call of its own
+    # (the MediaTailor list operations all page with MaxResults/NextToken)
+    def __init__(self, client, operation_name) -> None:
+        self.client = client
+        self.operation_name = operation_name
+
+    def paginate(self, PaginationConfig=None, **kwargs):
+        page_size = (PaginationConfig or {}).get("PageSize")
+        if page_size:
+            kwargs["MaxResults"] = page_size
+        while True:
+            page = self.client.call(self.operation_name, **kwargs)
+            yield page
+            if not page.get("NextToken"):
+                return
+            kwargs["NextToken"] = page["NextToken"]
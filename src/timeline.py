@@ -0,0 +1,112 @@
+from src import log
+from array import array
+from bisect import bisect_left, bisect_right
+
+logger = log.setup_custom_logger(__name__, loglevel="info")
+logger.debug(f"initiated module: {__name__}")
+
+KIND_CHAPTER = 0
+KIND_ADBREAK = 1
+
+
+class TimelineStore:
+    # columnar timelines of all parsed programs. Events are appended to the last program
+    # only, so the events of a program are one contiguous slice of the event columns.
+    def __init__(self) -> None:
+        self.wpks = []
+        self.program_start_ms = array("q")
+        self.program_first_event = array("q")
+        self.program_event_count = array("q")
+        self.event_start_ms = array("q")
+        self.event_media_ms = array("q")  # chapters: offset in the media, adbreaks: duration
+        self.event_kind = array("b")
+        self.event_program = array("q")
+        self.event_title = []
+        self._index = None
+
+    def __repr__(self) -> str:
+        return f"<TimelineStore {len(self)} programs, {len(self.event_kind)} events>"
+
+    def __len__(self):
+        return len(self.wpks)
+
+    def add_program(self, wpk, start_ms):
+        self.wpks.append(wpk)
+        self.program_start_ms.append(start_ms)
+        self.program_first_event.append(len(self.event_kind))
+        self.program_event_count.append(0)
+        self._index = None
+        return len(self.wpks) - 1
+
+    def add_event(self, program_index, kind, start_ms, media_ms, title=None):
+        assert program_index == len(self.wpks) - 1, "events go to the last program"
+        self.event_start_ms.append(start_ms)
+        self.event_media_ms.append(media_ms)
+        self.event_kind.append(kind)
+        self.event_program.append(program_index)
+        self.event_title.append(title)
+        self.program_event_count[program_index] += 1
+        self._index = None
+
+    def event_range(self, program_index):
+        first = self.program_first_event[program_index]
+        return range(first, first + self.program_event_count[program_index])
+
+    def last_event_end_ms(self, program_index):
+        end_ms = self.program_start_ms[program_index]
+        for event_index in self.event_range(program_index):
+            event_end_ms = self.event_start_ms[event_index]
+            if self.event_kind[event_index] == KIND_ADBREAK:
+                event_end_ms += self.event_media_ms[event_index]
+            end_ms = max(end_ms, event_end_ms)
+        return end_ms
+
+    @property
+    def index(self):
+        # (program indices, starts, ends) sorted by start. A program ends where the next one
+        # starts, the last one at the end of its last event. Rebuilt after adding programs/events
+        if self._index is None:
+            order = array(
+                "q",
+                sorted(range(len(self.wpks)), key=self.program_start_ms.__getitem__),
+            )
+            starts = array("q", (self.program_start_ms[i] for i in order))
+            ends = starts[1:]
+            if order:
+                ends.append(self.last_event_end_ms(order[-1]))
+            self._index = (order, starts, ends)
+        return self._index
+
+    @property
+    def order(self):
+        return self.index[0]
+
+    def programs_in_window(self, start_ms, end_ms):
+        # sorted program indices with start_ms <= program start <= end_ms
+        (order, starts, _) = self.index
+        return list(
+            order[bisect_left(starts, start_ms) : bisect_right(starts, end_ms)]
+        )
+
+    def programs_overlapping(self, start_ms, end_ms):
+        # sorted program indices on air at some point in [start_ms, end_ms)
+        (order, starts, ends) = self.index
+        return list(
+            order[bisect_right(ends, start_ms) : bisect_left(starts, end_ms)]
+        )
+
+    def program_on_air(self, at_ms):
+        # program index on air at `at_ms`, None when nothing is
+        (order, starts, ends) = self.index
+        position = bisect_right(starts, at_ms) - 1
+        if position < 0 or at_ms >= ends[position]:
+            return None
+        return order[position]
+
+    def chapter_offsets(self, program_index):
+        event_range = self.event_range(program_index)
+        kinds = self.event_kind[event_range.start : event_range.stop]
+        offsets = self.event_media_ms[event_range.start : event_range.stop]
+        return [
+            offset for (kind, offset) in zip(kinds, offsets) if kind == KIND_CHAPTER
+        ]
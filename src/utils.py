@@ -1,10 +1,8 @@
 from src import log
 import datetime
 
-import isodate
-
 logger = log.setup_custom_logger(__name__, loglevel="info")
-logger.info(f"initiated module: {__name__}")
+logger.debug(f"initiated module: {__name__}")
 
 
 def get_UTC_now():
@@ -23,10 +21,17 @@ def seconds_to_timedelta(seconds):
     return datetime.timedelta(seconds=seconds)
 
 
+def milliseconds_from_timestamp(timestamp):
+    # "HH:MM:SS[.fff]" -> milliseconds, without building datetimes
+    (hours, minutes, seconds) = timestamp.split(":")
+    (whole_seconds, _, fraction) = seconds.partition(".")
+    return (
+        int(hours) * 3600 + int(minutes) * 60 + int(whole_seconds)
+    ) * 1000 + int((fraction + "000")[:3])
+
+
 def get_offset_from_timestamp(timestamp):
-    start_of_time = datetime_from_isostring(f"1900-01-01T00:00:00Z")
-    point_in_time = datetime_from_isostring(f"1900-01-01T{timestamp}Z")
-    return (point_in_time - start_of_time).total_seconds()
+    return milliseconds_from_timestamp(timestamp) / 1000
 
 
 def pretty_datetime(dateObj):
@@ -37,13 +42,28 @@ def pretty_time(dateObj):
     return datetime.datetime.strftime(dateObj, "%H:%M:%S")
 
 
+EPOCH_UTC = datetime_from_isostring("1970-01-01T00:00:00Z")
+ONE_MILLISECOND = datetime.timedelta(milliseconds=1)
+
+
 def get_epoch_utc():
-    return datetime_from_isostring("1970-01-01T00:00:00Z")
+    return EPOCH_UTC
 
 
 def get_epoch_timestamp_milliseconds(dateObj):
-    epoch = get_epoch_utc()
-    return int((dateObj - epoch).total_seconds() * 1000)
+    return (dateObj - EPOCH_UTC) // ONE_MILLISECOND
+
+
+def epoch_milliseconds_from_isostring(iso_string):
+    return get_epoch_timestamp_milliseconds(datetime_from_isostring(iso_string))
+
+
+def datetime_from_epoch_milliseconds(milliseconds):
+    return EPOCH_UTC + datetime.timedelta(milliseconds=milliseconds)
+
+
+def get_UTC_now_milliseconds():
+    return get_epoch_timestamp_milliseconds(get_UTC_now())
 
 
 def seconds_from_iso_timestring(timestring):
@@ -51,4 +71,6 @@ def seconds_from_iso_timestring(timestring):
 
 
 def duration_from_iso_timestring(timestring):
+    import isodate  # imported on first use, most runs never parse a duration
+
     return isodate.parse_duration(timestring)
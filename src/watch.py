@@ -0,0 +1,196 @@
+from src import config
+from src import log
+from src import mediatailor as mt
+from src import playlist_parser as pp
+from src import utils
+import glob
+import os
+import time
+import xml.etree.ElementTree as ET
+
+logger = log.setup_custom_logger(__name__, loglevel="info")
+logger.debug(f"initiated module: {__name__}")
+
+
+def get_changed_window(old_programs, new_programs):
+    # (start_ms, end_ms) spanning the starts of the programs that differ between two plans,
+    # None when nothing changed. Matching heads and tails are left alone, like reconcile
+    old_fingerprints = [mt.get_planned_fingerprint(program) for program in old_programs]
+    new_fingerprints = [mt.get_planned_fingerprint(program) for program in new_programs]
+    shortest = min(len(old_fingerprints), len(new_fingerprints))
+    prefix = 0
+    while prefix < shortest and old_fingerprints[prefix] == new_fingerprints[prefix]:
+        prefix += 1
+    suffix = 0
+    while (
+        suffix < shortest - prefix
+        and old_fingerprints[-1 - suffix] == new_fingerprints[-1 - suffix]
+    ):
+        suffix += 1
+    changed = (
+        old_programs[prefix : len(old_programs) - suffix]
+        + new_programs[prefix : len(new_programs) - suffix]
+    )
+    if not changed:
+        return None
+    return (
+        min(program.start_ms for program in changed),
+        max(program.start_ms for program in changed),
+    )
+
+
+class PlaylistWatcher:
+    # polls a directory for playlists. A file is reported once its mtime and size are the
+    # same in two polls in a row, so files that are still being written are left alone
+    def __init__(self, directory, pattern="*.xml") -> None:
+        self.directory = directory
+        self.pattern = pattern
+        self.signatures = self.scan()
+        self._last_scan = dict(self.signatures)
+
+    def __repr__(self) -> str:
+        return f"<PlaylistWatcher {os.path.join(self.directory, self.pattern)}, {len(self.signatures)} files>"
+
+    @property
+    def fnames(self):
+        return sorted(self.signatures)
+
+    def scan(self):
+        signatures = {}
+        for fname in glob.glob(os.path.join(self.directory, self.pattern)):
+            try:
+                stat = os.stat(fname)
+            except FileNotFoundError:
+                continue
+            signatures[fname] = (stat.st_mtime_ns, stat.st_size)
+        return signatures
+
+    def poll(self):
+        # returns (changed or new files, removed files)
+        current = self.scan()
+        changed = [
+            fname
+            for (fname, signature) in current.items()
+            if self.signatures.get(fname) != signature
+            and self._last_scan.get(fname) == signature
+        ]
+        removed = [fname for fname in self.signatures if fname not in current]
+        for fname in changed:
+            self.signatures[fname] = current[fname]
+        for fname in removed:
+            del self.signatures[fname]
+        self._last_scan = current
+        return (sorted(changed), sorted(removed))
+
+
+class WatchPlanner:
+    # keeps the parsed records per file and the MediaTailor state (inventory, resolved
+    # video assets) between changes. A change re-parses the changed files only, and only
+    # the programs in the window that changed are provisioned and reconciled
+    def __init__(
+        self,
+        mediatailor,
+        target_date,
+        last_date=None,
+        force=False,
+        playlist_cache=None,
+        max_workers=config.PROVISION_WORKERS,
+    ) -> None:
+        self.mediatailor = mediatailor
+        self.target_date = target_date
+        self.last_date = last_date
+        self.force = force
+        self.playlist_cache = playlist_cache
+        self.max_workers = max_workers
+        self.file_records = {}
+        self.programs = None
+
+    def __repr__(self) -> str:
+        return f"<WatchPlanner {len(self.file_records)} files, {len(self.programs or [])} programs>"
+
+    def read_records(self, fname):
+        if not self.playlist_cache:
+            return pp.read_all_playlist_records(fname)
+        (file_hash, file_records) = self.playlist_cache.get(fname)
+        if file_records is None:
+            file_records = pp.read_all_playlist_records(fname)
+            self.playlist_cache.put(file_hash, *file_records)
+        return file_records
+
+    def update(self, changed, removed=()):
+        for fname in changed:
+            try:
+                self.file_records[fname] = self.read_records(fname)
+            except ET.ParseError as error:
+                logger.warning(f"{fname}: keeping the previous version, {error}")
+        for fname in removed:
+            self.file_records.pop(fname, None)
+
+    def get_playlist(self):
+        # files are merged in name order, the playlists are named by date
+        playlist = pp.PlaylistParser(self.target_date, self.last_date)
+        for fname in sorted(self.file_records):
+            playlist.add_all_records(*self.file_records[fname])
+        return playlist
+
+    def replan(self):
+        playlist = self.get_playlist()
+        programs = playlist.get_parsed_programs()
+        if self.programs is None:
+            window = (playlist.window_start_ms, playlist.window_end_ms)
+        else:
+            window = get_changed_window(self.programs, programs)
+        if not window:
+            logger.info("no program changes")
+            self.programs = programs
+            return
+        (start_ms, end_ms) = window
+        affected = [program for program in programs if start_ms <= program.start_ms <= end_ms]
+        logger.info(
+            f"replanning {len(affected)} programs from {utils.pretty_datetime(utils.datetime_from_epoch_milliseconds(start_ms))} to {utils.pretty_datetime(utils.datetime_from_epoch_milliseconds(end_ms))}"
+        )
+        # unavailable wpks are looked up again, the window is chained to the programs
+        # before and after it by reconcile
+        self.mediatailor.reset_schedule()
+        self.mediatailor.provision(affected, max_workers=self.max_workers)
+        for program in affected:
+            self.mediatailor.add_to_schedule(program)
+        if self.mediatailor.reconcile(
+            self.force,
+            window_start=utils.datetime_from_epoch_milliseconds(start_ms),
+            window_end=utils.datetime_from_epoch_milliseconds(end_ms),
+        ):
+            # otherwise the next change is planned against the last plan that was pushed
+            self.programs = programs
+
+    def run(self, watcher, poll_seconds=config.WATCH_POLL_SECONDS):
+        self.update(watcher.fnames)
+        self.replan()
+        logger.info(f"watching {watcher}")
+        # a failed replan is tried again after retry_delay, doubled while it keeps failing
+        # the same way; a change in the playlists is planned right away
+        (last_error, retry_at, retry_delay) = (None, None, poll_seconds)
+        while True:
+            time.sleep(poll_seconds)
+            (changed, removed) = watcher.poll()
+            if changed or removed:
+                logger.info(f"changed: {changed}, removed: {removed}")
+                self.update(changed, removed)
+                (last_error, retry_at, retry_delay) = (None, None, poll_seconds)
+            elif retry_at is None or time.monotonic() < retry_at:
+                continue
+            started = time.monotonic()
+            try:
+                self.replan()
+            except Exception as error:
+                if repr(error) == last_error:
+                    retry_delay = min(retry_delay * 2, config.WATCH_MAX_RETRY_SECONDS)
+                    logger.warning(
+                        f"replan failed again: {error!r}, next try in {retry_delay:.0f}s"
+                    )
+                else:
+                    logger.exception(f"replan failed: {error}")
+                (last_error, retry_at) = (repr(error), time.monotonic() + retry_delay)
+                continue
+            (last_error, retry_at, retry_delay) = (None, None, poll_seconds)
+            logger.info(f"replanned in {time.monotonic() - started:.2f}s")